@@ -1,10 +1,23 @@
-import paho.mqtt.client as mqtt
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QIntValidator
 from mqtt_init import *  # Import broker configurations from mqtt_init.py
+from mqtt_client import MqttClientBase
+from app_logging import setup_logging
+from instrumentation import count, gauge, start_metrics, timed
+from emergency_state import EmergencyStateTable
+from topic_router import TopicRouter
+from bracelet_frame import REGISTER_METRIC, decode_fleet_snapshot
+from patient_registry import BraceletIdCollision, PatientRegistry, parse_registration
+from alert_rules import AlertEvaluator, RuleReloader, load_rules
+from alert_state import AlertTracker
+from gui_bridge import GuiBridge
+from ward_model import WardTableModel
+from vitals_store import VitalsStore
 import sys
+import logging
 import random
+import time
 
 # Unique client name for the hospital
 global clientname
@@ -14,123 +27,136 @@ clientname = "HospitalClient-" + str(r)
 # Subscription topic for all smart bracelet data
 BRACELET_TOPIC = 'smartbracelet/#'
 
-# Thresholds for critical health metrics
-CRITICAL_BODY_TEMP = 39.0
-CRITICAL_HEART_RATE = 120
-CRITICAL_OXYGEN_LEVEL = 90
-CRITICAL_SUGAR_LEVEL = 200
+# History of every reading, query with: python vitals_store.py vitals.db BRACELET_ID METRIC
+VITALS_DB_FILE = "vitals.db"
 
-class MqttClient:
+# Who wears which bracelet, edit with: python patient_registry.py patients.db assign BRACELET_ID --patient NAME
+PATIENTS_DB_FILE = "patients.db"
+
+log = logging.getLogger("alerts")
+
+class MqttClient(MqttClientBase):
 
     def __init__(self):
-        self.broker = broker_ip
-        self.port = int(broker_port)
-        self.clientname = clientname
-        self.username = username
-        self.password = password
-        self.subscribeTopic = BRACELET_TOPIC
-        self.on_connected_to_form = None
-        self.emergency_status = False  # Track if there’s an emergency
-
-    # Setter methods for each attribute
-    def set_broker(self, value):
-        self.broker = value
-
-    def set_port(self, value):
-        self.port = value
-
-    def set_clientName(self, value):
-        self.clientname = value
-
-    def set_username(self, value):
-        self.username = value
-
-    def set_password(self, value):
-        self.password = value
-
-    def set_on_connected_to_form(self, on_connected_to_form):
-        self.on_connected_to_form = on_connected_to_form
-
-    def on_log(self, client, userdata, level, buf):
-        print("log:", buf)
-
-    def on_connect(self, client, userdata, flags, rc):
-        if rc == 0:
-            print("Connected successfully to broker.")
-            self.client.subscribe(self.subscribeTopic)  # Subscribe to all bracelet data
-            if callable(self.on_connected_to_form):
-                self.on_connected_to_form()  # Trigger the function when connected
-        else:
-            print("Failed to connect with code:", rc)
-
-    def on_disconnect(self, client, userdata, rc):
-        print("Disconnected with code:", rc)
-
-    def on_message(self, client, userdata, msg):
-        topic = msg.topic
-        message = str(msg.payload.decode("utf-8"))
-        print(f"Message received from {topic}: {message}")
-        self.check_emergency_status(topic, message)
-
-    def connect_to(self):
-        self.client = mqtt.Client(self.clientname, clean_session=True)
-        self.client.on_connect = self.on_connect
-        self.client.on_disconnect = self.on_disconnect
-        self.client.on_log = self.on_log
-        self.client.on_message = self.on_message
-        self.client.username_pw_set(self.username, self.password)
-        print(f"Connecting to broker {self.broker}:{self.port}")
-        self.client.connect(self.broker, self.port)
-        self.client.loop_start()  # Start the loop to maintain the connection
-
-    def disconnect_from(self):
-        self.client.disconnect()
-
-    def subscribe_to(self, topic):
-        self.client.subscribe(topic)
-
-    def check_emergency_status(self, topic, message):
-        """Check received health metrics and update emergency status."""
-        emergency_triggered = False
-
-        if "body_temp" in topic:
-            body_temp = float(message.split(": ")[1])
-            if body_temp > CRITICAL_BODY_TEMP:
-                print("ALERT: Critical body temperature detected!")
-                emergency_triggered = True
-        elif "heart_rate" in topic:
-            heart_rate = float(message.split(": ")[1])
-            if heart_rate > CRITICAL_HEART_RATE:
-                print("ALERT: Critical heart rate detected!")
-                emergency_triggered = True
-        elif "oxygen" in topic:
-            oxygen_level = float(message.split(": ")[1])
-            if oxygen_level < CRITICAL_OXYGEN_LEVEL:
-                print("ALERT: Low oxygen level detected!")
-                emergency_triggered = True
-        elif "sugar" in topic:
-            sugar_level = float(message.split(": ")[1])
-            if sugar_level > CRITICAL_SUGAR_LEVEL:
-                print("ALERT: High blood sugar level detected!")
-                emergency_triggered = True
-
-        # Update emergency status
-        self.emergency_status = emergency_triggered
-        mainwin.update_emergency_status()
+        super().__init__(clientname, BRACELET_TOPIC)  # Subscribe to all bracelet data
+        self.bridge = None  # GuiBridge that carries updates to the GUI thread
+        self.emergency_state = EmergencyStateTable()  # Per-bracelet emergency tracking
+        self.router = TopicRouter()
+        self.registry = PatientRegistry(PATIENTS_DB_FILE)  # Patient, ward and rule profile of each bracelet
+        self.registry.watch(self.on_registry_changed)  # Picks up edits from the command line
+        self.alerts = AlertEvaluator(self.with_profiles(load_rules()))  # Rolling window per bracelet and metric
+        self.rule_reloader = RuleReloader(lambda ruleset: self.alerts.set_rules(self.with_profiles(ruleset)))
+        self.alert_tracker = AlertTracker(alert_hold_seconds)  # Only raise/clear transitions get through
+        self.router.register_all(self.check_emergency_status)
+        self.vitals = VitalsStore(VITALS_DB_FILE, retention=vitals_retention_days * 86400)
+        self.router.register_all(self.vitals.add)  # Batched inserts on a writer thread
+        # Readings a bracelet queued while offline go into the history at their sample time, but raise no alerts
+        self.router.register_replay(self.vitals.add)
+        self.add_message_handler(self.router.dispatch)
+        self.add_message_handler(self.check_registration)
+        # Retained snapshots restore the ward on connect; they are not new readings, so not stored again
+        self.snapshot_router = TopicRouter(snapshot_max_age=snapshot_max_age)
+        self.snapshot_router.register_all(self.check_emergency_status)
+        self.add_retained_handler(self.dispatch_retained)
+        if use_fleet_snapshot:
+            self.subscribe_to(fleet_snapshot_topic)
+        gauge("vitals_queue_depth", self.vitals.queue.qsize)
+        gauge("critical_bracelets", lambda: len(self.emergency_state.critical_bracelets))
+
+    @property
+    def emergency_status(self):
+        return self.emergency_state.is_emergency()
+
+    def set_bridge(self, bridge):
+        self.bridge = bridge
+
+    def with_profiles(self, ruleset):
+        """Give every bracelet the rule group of its patient's profile in the registry."""
+        unknown = ruleset.set_profiles(self.registry.profiles())
+        if unknown:
+            log.warning("Profiles in the registry without a group in the alert rules: %s", ", ".join(sorted(set(unknown))))
+        return ruleset
+
+    def on_registry_changed(self):
+        self.with_profiles(self.alerts.ruleset)
+        self.bridge.notify("patients")
+
+    def patient_name(self, bracelet_id):
+        patient = self.registry.lookup(bracelet_id)
+        return f"bracelet {bracelet_id}" if patient is None or not patient.patient \
+            else f"{patient.label()}, bracelet {bracelet_id}"
+
+    def check_registration(self, topic, payload):
+        """Bind a bracelet announcing itself to its id, or report that another device already uses the id.
+
+        A bracelet's will (online false) frees the id, but only if it is the will of the bound device.
+        """
+        bracelet_id, metric, handlers = self.router.route(topic)
+        if metric != REGISTER_METRIC:
+            return
+        try:
+            device_id, customer, online = parse_registration(payload)
+            if online:
+                self.registry.register_device(bracelet_id, device_id, customer)
+            elif not self.registry.release_device(bracelet_id, device_id):
+                return
+        except BraceletIdCollision as error:
+            log.error("Bracelet id collision: %s", error)
+            count("bracelet_id_collisions")
+            return
+        except ValueError as error:
+            log.warning("Ignoring a registration on %s: %s", topic, error)
+            return
+        self.bridge.notify("patients")
+
+    def dispatch_retained(self, topic, payload):
+        if topic != fleet_snapshot_topic:
+            # Registrations are retained too, so a restarted hospital learns which devices came and went
+            self.check_registration(topic, payload)
+            self.snapshot_router.dispatch_retained(topic, payload)
+            return
+        try:
+            entries = decode_fleet_snapshot(payload)
+        except ValueError:
+            log.warning("Ignoring a bad fleet snapshot on %s", topic)
+            return
+        # Like the per-bracelet snapshots, entries older than snapshot_max_age are from bracelets that went
+        # away, or the whole snapshot was left by an aggregator that stopped
+        cutoff = time.time() - snapshot_max_age
+        for bracelet_id, timestamp, values in entries:
+            if timestamp >= cutoff:
+                self.snapshot_router.dispatch_values(bracelet_id, values)
+
+    @timed("check_emergency_status")
+    def check_emergency_status(self, bracelet_id, metric, value):
+        """Check a received health metric and update that bracelet's emergency state."""
+        alert, changed = self.alert_tracker.update(bracelet_id, metric, self.alerts.evaluate(bracelet_id, metric, value))
+        if changed:
+            if alert is not None:
+                log.warning("ALERT: %s detected on %s!", alert, self.patient_name(bracelet_id))
+            else:
+                log.info("Cleared: %s back to normal on %s", metric, self.patient_name(bracelet_id))
+
+        # Only resort the ward when this bracelet's emergency state actually changed
+        if self.emergency_state.update(bracelet_id, metric, alert is not None):
+            self.bridge.notify("emergency")
+        self.bridge.post(bracelet_id, metric, value)
 
 
 class HospitalInterface(QDockWidget):
+    # Emitted on paho's network thread; Qt queues it, so on_connected runs on the GUI thread
+    connected = pyqtSignal()
 
     def __init__(self, mc):
         super().__init__()
 
         self.mc = mc
-        self.mc.set_on_connected_to_form(self.on_connected)
+        self.connected.connect(self.on_connected)
+        self.mc.set_on_connected_to_form(self.connected.emit)
 
         # Interface elements for MQTT connection
         self.eHostInput = QLineEdit()
-        self.eHostInput.setInputMask('999.999.999.999')
-        self.eHostInput.setText(broker_ip)
+        self.eHostInput.setText(self.mc.broker)  # IP, or host name if DNS was unavailable
 
         self.ePort = QLineEdit()
         self.ePort.setValidator(QIntValidator())
@@ -172,8 +198,9 @@ class HospitalInterface(QDockWidget):
         self.mc.set_clientName(self.eClientID.text())
         self.mc.set_username(self.eUserName.text())
         self.mc.set_password(self.ePassword.text())
-        self.mc.connect_to()
         self.mc.subscribe_to(self.eSubscribeTopic.text())
+        self.mc.connect_to()
+        self.mc.start_listening()
 
 
 class MainWindow(QMainWindow):
@@ -181,27 +208,62 @@ class MainWindow(QMainWindow):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.mc = MqttClient()
-        self.setGeometry(50, 50, 400, 250)
+        self.bridge = GuiBridge(gui_fps, self)
+        self.bridge.flushed.connect(self.apply_updates)
+        self.mc.set_bridge(self.bridge)
+        gauge("gui_pending_updates", lambda: len(self.bridge.pending))
+        self.setGeometry(50, 50, 800, 600)
         self.setWindowTitle('Hospital Emergency Monitor')
 
+        central_widget = QWidget(self)
+        self.setCentralWidget(central_widget)
+        layout = QVBoxLayout(central_widget)
+
         # Emergency Status Label
         self.emergency_label = QLabel("Emergency: Everything is fine", self)
-        self.emergency_label.setGeometry(50, 100, 300, 30)
+        layout.addWidget(self.emergency_label)
+
+        # Ward table, one row per bracelet; the view only paints the visible rows
+        self.ward_model = WardTableModel(self, self.mc.registry.lookup)
+        self.ward_view = QTableView(self)
+        self.ward_view.setModel(self.ward_model)
+        self.ward_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.ward_view.verticalHeader().setVisible(False)
+        # Fixed row heights and column widths, so no row is measured as the ward grows
+        self.ward_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.ward_view.verticalHeader().setDefaultSectionSize(22)
+        self.ward_view.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.ward_view.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.ward_view)
 
         # Hospital interface dock widget
         self.hospitalInterface = HospitalInterface(self.mc)
         self.addDockWidget(Qt.TopDockWidgetArea, self.hospitalInterface)
 
+    @timed("gui_apply_updates")
+    def apply_updates(self, readings, events):
+        """Runs in the GUI thread with the updates coalesced since the last frame."""
+        if readings:
+            self.ward_model.update(readings)
+        if "emergency" in events:
+            self.update_emergency_status()
+        if "patients" in events:
+            self.ward_model.patients_changed()
+
     def update_emergency_status(self):
-        """Update the emergency label based on the client's health status."""
-        if self.mc.emergency_status:
-            self.emergency_label.setText("Emergency: Yes")
+        """Update the emergency label and the ward order from the per-bracelet emergency table."""
+        critical = self.mc.emergency_state.critical_snapshot()
+        self.ward_model.set_critical(critical)
+        if critical:
+            self.emergency_label.setText(f"Emergency: Yes - {len(critical)} of {self.ward_model.rowCount()} bracelets critical")
             self.emergency_label.setStyleSheet("color: red; font-weight: bold;")
         else:
             self.emergency_label.setText("Emergency: Everything is fine")
             self.emergency_label.setStyleSheet("color: green; font-weight: bold;")
 
 
+setup_logging(log_level, log_levels)
+start_metrics("hospital")
 app = QApplication(sys.argv)
 mainwin = MainWindow()
 mainwin.show()
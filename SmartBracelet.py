@@ -1,104 +1,152 @@
-import paho.mqtt.client as mqtt
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt, QTimer  # Import QTimer from QtCore
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal  # Import QTimer from QtCore
 from PyQt5.QtGui import QIntValidator  # Correct import for QIntValidator
 from mqtt_init import *  # Import configuration from mqtt_init.py
+from bracelet_frame import FRAME_METRIC, METRICS, encode_frame
+from bracelet_metrics import (drift_readings, frame_topic, generate_readings, metric_topic, register_topic,
+                              replay_topic, snapshot_topic, text_payload)
+from patient_registry import registration_payload
+from mqtt_client import MqttClientBase
+from app_logging import setup_logging
+from instrumentation import gauge, start_metrics, timed
+from store_forward import StoreAndForward
+from publish_pipeline import PublishPipeline
+from adaptive_sampling import AdaptiveSampler
+from alert_rules import RuleReloader, load_rules
+import math
+import os
 import random
 import sys
+import uuid
+import logging
+import time
 
 # Creating unique client name and health variables
-global clientname, CONNECTED, current_body_temp, current_heart_rate, current_oxygen, current_sugar
-CONNECTED = False
+global clientname, current_body_temp, current_heart_rate, current_oxygen, current_sugar
 r = random.randrange(1, 10000000)
 clientname = "IOT_client-IdBracelet-" + str(r)
-bracelet_id = random.randrange(1, 100)
+# The bracelet id assigned in the registry: python SmartBracelet.py 12, a random one otherwise
+ASSIGNED_IDS = [arg for arg in sys.argv[1:] if arg.isdigit()]
+bracelet_id = int(ASSIGNED_IDS[0]) if ASSIGNED_IDS else random.randrange(1, 10000)
 
 # Define topics for each health metric
-BODY_TEMP_TOPIC = f'smartbracelet/{bracelet_id}/body_temp'
-HEART_RATE_TOPIC = f'smartbracelet/{bracelet_id}/heart_rate'
-OXYGEN_TOPIC = f'smartbracelet/{bracelet_id}/oxygen'
-SUGAR_TOPIC = f'smartbracelet/{bracelet_id}/sugar'
-update_rate = 5000  # in milliseconds
-
-class MqttClient:
+BODY_TEMP_TOPIC = metric_topic(bracelet_id, 'body_temp')
+HEART_RATE_TOPIC = metric_topic(bracelet_id, 'heart_rate')
+OXYGEN_TOPIC = metric_topic(bracelet_id, 'oxygen')
+SUGAR_TOPIC = metric_topic(bracelet_id, 'sugar')
+METRIC_TOPICS = dict(zip(METRICS, (BODY_TEMP_TOPIC, HEART_RATE_TOPIC, OXYGEN_TOPIC, SUGAR_TOPIC)))
+FRAME_TOPIC = frame_topic(bracelet_id)  # All metrics in one message when packed_frames is on
+# Retained latest values for new subscribers: the frame itself when packed, else a snapshot frame next to the text
+SNAPSHOT_TOPIC = FRAME_TOPIC if packed_frames else snapshot_topic(bracelet_id)
+REGISTER_TOPIC = register_topic(bracelet_id)
+REPLAY_TOPIC = replay_topic(bracelet_id)  # Readings queued while offline, sent after reconnect
+
+# Tells this device apart in the hospital's registry when two pick the same bracelet id; it must survive
+# restarts, so it is kept in DEVICE_ID_FILE (or set with $BRACELET_DEVICE_ID, as runAll.py does per bracelet)
+DEVICE_ID_FILE = f"bracelet_device_id-{bracelet_id}"
+
+def load_device_id():
+    if os.environ.get("BRACELET_DEVICE_ID"):
+        return os.environ["BRACELET_DEVICE_ID"]
+    try:
+        with open(DEVICE_ID_FILE) as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        pass
+    # Written whole under another name, then linked in place: a bracelet started at the same moment
+    # either sees no file or the complete one, and only the first link wins
+    new_id = uuid.uuid4().hex
+    temp_file = f"{DEVICE_ID_FILE}.{new_id}"
+    with open(temp_file, "w") as file:
+        file.write(new_id + "\n")
+    try:
+        os.link(temp_file, DEVICE_ID_FILE)
+    except FileExistsError:
+        with open(DEVICE_ID_FILE) as file:
+            new_id = file.read().strip()
+    finally:
+        os.remove(temp_file)
+    return new_id
+
+device_id = load_device_id()
+update_rate = 5000  # in milliseconds, fast_update_rate while a value is near an alert threshold
+delivery_report_rate = 60000  # in milliseconds, how often publish rate / ack latency / drops are logged
+
+log = logging.getLogger("mqtt")
+delivery_log = logging.getLogger("delivery")
+
+class MqttClient(MqttClientBase):
 
     def __init__(self):
-        self.broker = broker_ip
-        self.port = int(broker_port)
-        self.clientname = clientname
-        self.username = username
-        self.password = password
-        self.on_connected_to_form = ''
-
-    # Setter methods for each attribute
-    def set_broker(self, value):
-        self.broker = value
-
-    def set_port(self, value):
-        self.port = value
-
-    def set_clientName(self, value):
-        self.clientname = value
-
-    def set_username(self, value):
-        self.username = value
-
-    def set_password(self, value):
-        self.password = value
-
-    def set_on_connected_to_form(self, on_connected_to_form):
-        self.on_connected_to_form = on_connected_to_form
-
-    def on_log(self, client, userdata, level, buf):
-        print("log:", buf)
+        super().__init__(clientname)
+        # Readings go through the offline queue, then the QoS window, then paho
+        rules = load_rules().rules_of(bracelet_id)
+        self.pipeline = PublishPipeline(rules)
+        # Only readings that moved past their deadband, or are near a threshold, are published
+        self.sampler = AdaptiveSampler(rules, deadbands, heartbeat_seconds, update_rate, fast_update_rate, approach_margins)
+        self.rule_reloader = RuleReloader(self.set_rules)
+        self.outbox = StoreAndForward()  # Keeps readings while offline and replays them after reconnect
+        self.outbox.set_client(self.pipeline)
+        gauge("outbox_queued", self.outbox.queued)
+        gauge("publish_in_flight", lambda: self.pipeline.in_flight()[0])
+        gauge("publish_pending", lambda: self.pipeline.in_flight()[1])
+        gauge("readings_skipped", lambda: self.sampler.skipped)
+
+    def set_rules(self, ruleset):
+        rules = ruleset.rules_of(bracelet_id)
+        self.pipeline.set_rules(rules)
+        self.sampler.set_rules(rules)
 
     def on_connect(self, client, userdata, flags, rc):
-        global CONNECTED
+        super().on_connect(client, userdata, flags, rc)
         if rc == 0:
-            print("Connected successfully.")
-            CONNECTED = True
-            self.on_connected_to_form()
-        else:
-            print("Connection failed with code:", rc)
+            if self.outbox.queued():
+                log.info("Replaying %d readings queued while offline", self.outbox.queued())
+            self.outbox.on_connected()
+            # Announce the device on every connect, the hospital refuses it if the id is taken.
+            # Retained, so a hospital started later still learns which device is online
+            self.publish_to(REGISTER_TOPIC, registration_payload(device_id, customer_id), qos=1, retain=True)
 
     def on_disconnect(self, client, userdata, rc=0):
-        print("Disconnected result code", rc)
+        self.outbox.on_disconnected()
+        super().on_disconnect(client, userdata, rc)
 
     def connect_to(self):
-        self.client = mqtt.Client(self.clientname, clean_session=True)
-        self.client.on_connect = self.on_connect
-        self.client.on_disconnect = self.on_disconnect
-        self.client.on_log = self.on_log
-        self.client.username_pw_set(self.username, self.password)
-        print("Connecting to broker", self.broker)
-        self.client.connect(self.broker, self.port)
-
-    def disconnect_from(self):
-        self.client.disconnect()
-
-    def start_listening(self):
-        self.client.loop_start()
-
-    def stop_listening(self):
-        self.client.loop_stop()
-
-    def publish_to(self, topic, message):
-        if CONNECTED:
-            self.client.publish(topic, message)
-        else:
-            print("Connection is not established, cannot publish.")
+        super().connect_to()
+        # If the bracelet drops off, the broker announces which device went away; dashboards skip its
+        # retained snapshot once it is older than snapshot_max_age
+        self.client.will_set(REGISTER_TOPIC, registration_payload(device_id, customer_id, online=False), qos=1,
+                             retain=True)
+        self.pipeline.set_client(self.client)
+
+    def print_delivery_report(self):
+        report = self.pipeline.report()
+        for topic, stats in report.items():
+            delivery_log.info("Delivery %s: %s", topic, stats)
+        delivery_log.info("Published %d messages", sum(stats["published"] for stats in report.values()))
+        delivery_log.info("Readings skipped inside their deadband: %d", self.sampler.skipped)
+
+    def publish_to(self, topic, message, qos=0, retain=False):
+        self.outbox.publish(topic, message, qos, retain)
+
+    @timed("publish_readings")
+    def publish_readings(self, messages, replay):
+        """Publish one sample's messages; what cannot go out is queued as replay(unsent) returns it."""
+        if not self.outbox.publish_many(messages, replay) and self.outbox.queued() == 1:
+            log.warning("Connection is not established, queueing readings until it is back.")
 
 class ConnectionDock(QDockWidget):
+    connected = pyqtSignal()  # Crosses from paho's thread to the GUI thread
 
     def __init__(self, mc):
         QDockWidget.__init__(self)
         self.mc = mc
-        self.mc.set_on_connected_to_form(self.on_connected)
+        self.connected.connect(self.on_connected)
+        self.mc.set_on_connected_to_form(self.connected.emit)
 
         # Broker connection fields
         self.eHostInput = QLineEdit()
-        self.eHostInput.setInputMask('999.999.999.999')
-        self.eHostInput.setText(broker_ip)
+        self.eHostInput.setText(self.mc.broker)  # IP, or host name if DNS was unavailable
 
         self.ePort = QLineEdit()
         self.ePort.setValidator(QIntValidator())
@@ -142,6 +190,10 @@ class ConnectionDock(QDockWidget):
         publishLayout.addRow("Heart Rate Topic", QLabel(HEART_RATE_TOPIC))
         publishLayout.addRow("Oxygen Topic", QLabel(OXYGEN_TOPIC))
         publishLayout.addRow("Blood Sugar Topic", QLabel(SUGAR_TOPIC))
+        if packed_frames:
+            publishLayout.addRow("Packed Frame Topic", QLabel(FRAME_TOPIC))
+        elif retained_snapshots:
+            publishLayout.addRow("Snapshot Topic", QLabel(SNAPSHOT_TOPIC))
         publishTopicsBox.setLayout(publishLayout)
 
         # Main layout widget
@@ -172,23 +224,28 @@ class MainWindow(QMainWindow):
     def __init__(self, parent=None):
         QMainWindow.__init__(self, parent)
         self.mc = MqttClient()
+        self.frame_seq = 0
+        self.values = None  # Last sample, the next one drifts from it
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_data)
         self.timer.start(update_rate)
+        self.report_timer = QTimer(self)
+        self.report_timer.timeout.connect(self.mc.print_delivery_report)
+        self.report_timer.start(delivery_report_rate)
 
         self.setGeometry(30, 600, 400, 200)
-        self.setWindowTitle('Smart Bracelet Health Monitor')
+        self.setWindowTitle(f'Smart Bracelet {bracelet_id} Health Monitor')  # The id a smartphone pairs with
 
         self.connectionDock = ConnectionDock(self.mc)
         self.addDockWidget(Qt.TopDockWidgetArea, self.connectionDock)
 
+    @timed("gui_update_data")
     def update_data(self):
-        # Generate random health metric values to simulate real data
+        # Simulate real data: random values at first, then a small drift from the last sample
         global current_body_temp, current_heart_rate, current_oxygen, current_sugar
-        current_body_temp = round(random.uniform(36, 42), 2)
-        current_heart_rate = round(random.uniform(60, 150), 2)
-        current_oxygen = round(random.uniform(85, 100), 2)
-        current_sugar = round(random.uniform(80, 300), 2)
+        values = drift_readings(self.values) if self.values else generate_readings()
+        self.values = values
+        current_body_temp, current_heart_rate, current_oxygen, current_sugar = values
 
         # Update GUI with health metric values
         self.connectionDock.BodyTemp.setText(str(current_body_temp))
@@ -196,13 +253,45 @@ class MainWindow(QMainWindow):
         self.connectionDock.Oxygen.setText(str(current_oxygen))
         self.connectionDock.Sugar.setText(str(current_sugar))
 
-        # Publish each health metric to its respective MQTT topic
-        self.mc.publish_to(BODY_TEMP_TOPIC, f'Body Temperature: {current_body_temp}')
-        self.mc.publish_to(HEART_RATE_TOPIC, f'Heart Rate: {current_heart_rate}')
-        self.mc.publish_to(OXYGEN_TOPIC, f'Oxygen Level: {current_oxygen}')
-        self.mc.publish_to(SUGAR_TOPIC, f'Blood Sugar: {current_sugar}')
-
-
+        # Sample faster while a value is close to an alert threshold
+        sampler = self.mc.sampler
+        interval = sampler.next_interval(values)
+        if interval != self.timer.interval():
+            self.timer.setInterval(interval)
+        selected = sampler.select(values, whole=packed_frames)
+        if not selected:
+            return
+
+        # One frame carries all four metrics, a timestamp and a sequence number
+        self.frame_seq += 1
+        now = time.time()
+        qos_for = self.mc.pipeline.qos_for
+        if packed_frames:
+            messages = [(FRAME_TOPIC, encode_frame(values, self.frame_seq, now, frame_format),
+                         qos_for(FRAME_METRIC, values), retained_snapshots)]
+        else:
+            messages = []
+            if retained_snapshots:
+                messages.append((SNAPSHOT_TOPIC, encode_frame(values, self.frame_seq, now), 0, True))
+            # Publish each selected metric to its MQTT topic, QoS 1 only when it is critical
+            messages += [(METRIC_TOPICS[metric], text_payload(metric, value), qos_for(metric, value), False)
+                         for metric, value in zip(METRICS, values) if metric in selected]
+        seq = self.frame_seq
+
+        def replay(unsent):
+            # Readings that did not go out are queued as a replay frame, so they reach the hospital with
+            # their own time; NaN stands for the metrics that did go out (or were not due)
+            topics = {message[0] for message in unsent}
+            kept = [value if FRAME_TOPIC in topics or METRIC_TOPICS[metric] in topics else math.nan
+                    for metric, value in zip(METRICS, values)]
+            if all(math.isnan(value) for value in kept):
+                return []  # Only the retained snapshot was left, the next sample replaces it
+            return [(REPLAY_TOPIC, encode_frame(kept, seq, now, frame_format), qos_for(FRAME_METRIC, values), False)]
+
+        self.mc.publish_readings(messages, replay)
+
+setup_logging(log_level, log_levels)
+start_metrics("bracelet")
 app = QApplication(sys.argv)
 mainwin = MainWindow()
 mainwin.show()
@@ -1,172 +1,141 @@
-import paho.mqtt.client as mqtt
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QIntValidator
 from mqtt_init import *  # Import MQTT broker configurations
+from mqtt_client import MqttClientBase
+from app_logging import setup_logging
+from instrumentation import gauge, start_metrics, timed
 import sys
+import logging
 import random
 import datetime
+import threading
+from topic_router import TopicRouter
+from bracelet_frame import METRICS
+from bracelet_metrics import METRIC_LABELS, bracelet_topic
+from alert_rules import AlertEvaluator, RuleReloader, load_rules
+from alert_state import AlertTracker
+from gui_bridge import GuiBridge
+from health_log import HealthLogWriter
 
 # Unique client name for the smartphone
 global clientname
 r = random.randrange(1, 10000000)
 clientname = "SmartPhoneClient-" + str(r)
 
-# Subscription topic for all smart bracelet data
-BRACELET_TOPIC = 'smartbracelet/#'
+# Bracelets to pair with at start: python Smartphone.py 12 40
+PAIRED_AT_START = [arg for arg in sys.argv[1:] if arg.isdigit()]
 
-# Thresholds for critical health metrics
-CRITICAL_BODY_TEMP = 39.0
-CRITICAL_HEART_RATE = 120
-CRITICAL_OXYGEN_LEVEL = 90
-CRITICAL_SUGAR_LEVEL = 200
+# Structured (JSON lines) health log, rotated into health_metrics_log.jsonl.1, .2, ...
+HEALTH_LOG_FILE = "health_metrics_log.jsonl"
 
-class MqttClient:
+log = logging.getLogger("alerts")
 
-    def __init__(self):
-        self.broker = broker_ip
-        self.port = int(broker_port)
-        self.clientname = clientname
-        self.username = username
-        self.password = password
-        self.subscribeTopic = BRACELET_TOPIC
-        self.on_connected_to_form = ''
-        self.emergency_status = False  # Track if there’s an emergency
-        # Latest values for each health metric
-        self.latest_heart_rate = "N/A"
-        self.latest_body_temp = "N/A"
-        self.latest_oxygen = "N/A"
-        self.latest_sugar = "N/A"
-
-    def set_broker(self, value):
-        self.broker = value
-
-    def set_port(self, value):
-        self.port = value
-
-    def set_clientName(self, value):
-        self.clientname = value
+class MqttClient(MqttClientBase):
+    """Receives only the bracelets the phone is paired with, one narrow subscription each.
 
-    def set_username(self, value):
-        self.username = value
+    pairing_lock covers the paired state together with the alert windows, so an
+    unpair from the GUI thread never interleaves with an evaluation on the
+    network thread: a reading either lands before the unpair, which then
+    forgets it, or finds the bracelet gone.
+    """
 
-    def set_password(self, value):
-        self.password = value
-
-    def set_on_connected_to_form(self, on_connected_to_form):
-        self.on_connected_to_form = on_connected_to_form
-
-    def on_log(self, client, userdata, level, buf):
-        print("log:", buf)
-
-    def on_connect(self, client, userdata, flags, rc):
-        if rc == 0:
-            print("Connected successfully to broker.")
-            self.client.subscribe(self.subscribeTopic)
-            if callable(self.on_connected_to_form):
-                self.on_connected_to_form()
-        else:
-            print("Failed to connect with code:", rc)
-
-    def on_disconnect(self, client, userdata, rc):
-        print("Disconnected with code:", rc)
-
-    def on_message(self, client, userdata, msg):
-        topic = msg.topic
-        message = str(msg.payload.decode("utf-8"))
-        print(f"Message received from {topic}: {message}")
-        self.check_critical_values(topic, message)
-
-        # Update relevant metric based on topic
-        if "heart_rate" in topic:
-            self.latest_heart_rate = message.split(": ")[1]
-            mainwin.update_heart_rate_display()
-        elif "body_temp" in topic:
-            self.latest_body_temp = message.split(": ")[1]
-            mainwin.update_body_temp_display()
-        elif "oxygen" in topic:
-            self.latest_oxygen = message.split(": ")[1]
-            mainwin.update_oxygen_display()
-        elif "sugar" in topic:
-            self.latest_sugar = message.split(": ")[1]
-            mainwin.update_sugar_display()
-
-    def connect_to(self):
-        self.client = mqtt.Client(self.clientname, clean_session=True)
-        self.client.on_connect = self.on_connect
-        self.client.on_disconnect = self.on_disconnect
-        self.client.on_log = self.on_log
-        self.client.on_message = self.on_message
-        self.client.username_pw_set(self.username, self.password)
-        print(f"Connecting to broker {self.broker}:{self.port}")
-        self.client.connect(self.broker, self.port)
-
-    def disconnect_from(self):
-        self.client.disconnect()
-
-    def start_listening(self):
-        self.client.loop_start()
-
-    def stop_listening(self):
-        self.client.loop_stop()
-
-    def subscribe_to(self, topic):
-        self.client.subscribe(topic)
-
-    def check_critical_values(self, topic, message):
-        emergency_triggered = False
-
-        if "body_temp" in topic:
-            body_temp = float(message.split(": ")[1])
-            if body_temp > CRITICAL_BODY_TEMP:
-                print("ALERT: Critical body temperature detected!")
-                emergency_triggered = True
-        elif "heart_rate" in topic:
-            heart_rate = float(message.split(": ")[1])
-            if heart_rate > CRITICAL_HEART_RATE:
-                print("ALERT: Critical heart rate detected!")
-                emergency_triggered = True
-        elif "oxygen" in topic:
-            oxygen_level = float(message.split(": ")[1])
-            if oxygen_level < CRITICAL_OXYGEN_LEVEL:
-                print("ALERT: Low oxygen level detected!")
-                emergency_triggered = True
-        elif "sugar" in topic:
-            sugar_level = float(message.split(": ")[1])
-            if sugar_level > CRITICAL_SUGAR_LEVEL:
-                print("ALERT: High blood sugar level detected!")
-                emergency_triggered = True
-
-        self.emergency_status = emergency_triggered
-        mainwin.update_emergency_status()
+    def __init__(self):
+        super().__init__(clientname)
+        self.bridge = None  # GuiBridge that carries updates to the GUI thread
+        self.emergency_status = False  # Track if there’s an emergency
+        self.health_log = HealthLogWriter(HEALTH_LOG_FILE)
+        self.latest = {}       # paired bracelet_id -> {metric: latest value}
+        self.emergencies = {}  # paired bracelet_id -> frozenset of metrics in alert
+        self.pairing_lock = threading.Lock()
+        self.router = TopicRouter(snapshot_max_age=snapshot_max_age)
+        self.alerts = AlertEvaluator(load_rules())  # Rolling window per bracelet and metric
+        self.rule_reloader = RuleReloader(self.alerts.set_rules)  # Picks up edits to alert_rules.json
+        self.alert_tracker = AlertTracker(alert_hold_seconds)  # Only raise/clear transitions get through
+        self.router.register_all(self.check_critical_values)
+        self.router.register_all(self.update_metric)
+        self.add_message_handler(self.router.dispatch)
+        self.add_retained_handler(self.router.dispatch_retained)  # A paired bracelet's latest values at once
+        gauge("health_log_queue_depth", self.health_log.queue.qsize)
+
+    def set_bridge(self, bridge):
+        self.bridge = bridge
+
+    def pair(self, bracelet_id):
+        """Start following a bracelet; call from the GUI thread."""
+        with self.pairing_lock:
+            if bracelet_id in self.latest:
+                return
+            self.latest[bracelet_id] = dict.fromkeys(METRICS, "N/A")
+            self.emergencies[bracelet_id] = frozenset()
+        self.subscribe_to(bracelet_topic(bracelet_id))
+
+    def unpair(self, bracelet_id):
+        self.unsubscribe_from(bracelet_topic(bracelet_id))
+        with self.pairing_lock:
+            if bracelet_id not in self.latest:
+                return
+            del self.latest[bracelet_id]
+            del self.emergencies[bracelet_id]
+            self.alerts.forget(bracelet_id)
+            self.alert_tracker.forget(bracelet_id)
+            self.emergency_status = any(self.emergencies.values())
+
+    def paired(self):
+        return list(self.latest)
+
+    # Keeps the latest value of each metric; the GUI repaints on the next bridge flush
+    def update_metric(self, bracelet_id, metric, value):
+        latest = self.latest.get(bracelet_id)
+        if latest is None:
+            return  # In flight when the bracelet was unpaired
+        latest[metric] = value
+        self.bridge.post(bracelet_id, metric, value)
+
+    @timed("check_critical_values")
+    def check_critical_values(self, bracelet_id, metric, value):
+        with self.pairing_lock:
+            metrics = self.emergencies.get(bracelet_id)
+            if metrics is None:
+                return
+            alert, changed = self.alert_tracker.update(bracelet_id, metric,
+                                                       self.alerts.evaluate(bracelet_id, metric, value))
+            if not changed:
+                return
+            # A new frozenset, so the GUI thread never sees one being changed
+            self.emergencies[bracelet_id] = metrics | {metric} if alert is not None else metrics - {metric}
+            self.emergency_status = any(self.emergencies.values())
+        if alert is not None:
+            log.warning("ALERT: %s detected on bracelet %s!", alert, bracelet_id)
+        self.bridge.notify("emergency")  # The labels and the emergency log follow transitions only
 
     def save_logs(self):
-        """Save current health metrics to a log file."""
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_message = (
-            f"{timestamp}\n"
-            f"Emergency Status: {'Yes' if self.emergency_status else 'No'}\n"
-            f"Heart Rate: {self.latest_heart_rate}\n"
-            f"Body Temp: {self.latest_body_temp}\n"
-            f"Oxygen Level: {self.latest_oxygen}\n"
-            f"Blood Sugar: {self.latest_sugar}\n\n"
-        )
-        with open("health_metrics_log.txt", "a") as file:
-            file.write(log_message)
-        print("Logs saved to health_metrics_log.txt")
+        """Queue the current health metrics of every paired bracelet for the background log writer."""
+        now = datetime.datetime.now()
+        for bracelet_id, latest in list(self.latest.items()):
+            record = {
+                "ts": now.timestamp(),
+                "time": now.strftime("%Y-%m-%d %H:%M:%S"),
+                "bracelet_id": bracelet_id,
+                "emergency": bool(self.emergencies.get(bracelet_id)),
+            }
+            record.update(latest)
+            self.health_log.write(record)
+        log.info("Logs queued for %s", HEALTH_LOG_FILE)
 
 
 class SmartPhoneInterface(QDockWidget):
+    connected = pyqtSignal()  # Emitted on the network thread, on_connected runs queued on the GUI thread
 
     def __init__(self, mc):
         super().__init__()
         self.mc = mc
-        self.mc.set_on_connected_to_form(self.on_connected)
+        self.connected.connect(self.on_connected)
+        self.mc.set_on_connected_to_form(self.connected.emit)
 
         # MQTT connection fields
         self.eHostInput = QLineEdit()
-        self.eHostInput.setInputMask('999.999.999.999')
-        self.eHostInput.setText(broker_ip)
+        self.eHostInput.setText(self.mc.broker)  # IP, or host name if DNS was unavailable
 
         self.ePort = QLineEdit()
         self.ePort.setValidator(QIntValidator())
@@ -186,12 +155,19 @@ class SmartPhoneInterface(QDockWidget):
         self.eConnectBtn.clicked.connect(self.on_button_connect_click)
         self.eConnectBtn.setStyleSheet("background-color: gray")
 
-        self.eSubscribeTopic = QLineEdit()
-        self.eSubscribeTopic.setText(BRACELET_TOPIC)
+        # Pairing: the phone only subscribes to the bracelets paired here
+        self.eBraceletID = QLineEdit()
+        self.eBraceletID.setValidator(QIntValidator(1, 999999))
+        self.ePairBtn = QPushButton("Pair", self)
+        self.eUnpairBtn = QPushButton("Unpair", self)
+        pairing = QHBoxLayout()
+        pairing.addWidget(self.eBraceletID)
+        pairing.addWidget(self.ePairBtn)
+        pairing.addWidget(self.eUnpairBtn)
 
         layout = QFormLayout()
         layout.addRow("Connect", self.eConnectBtn)
-        layout.addRow("Subscription Topic", self.eSubscribeTopic)
+        layout.addRow("Bracelet ID", pairing)
 
         widget = QWidget(self)
         widget.setLayout(layout)
@@ -210,7 +186,33 @@ class SmartPhoneInterface(QDockWidget):
         self.mc.set_password(self.ePassword.text())
         self.mc.connect_to()
         self.mc.start_listening()
-        self.mc.subscribe_to(self.eSubscribeTopic.text())
+
+
+class PatientPanel(QGroupBox):
+    """Latest values and emergency state of one paired bracelet."""
+
+    def __init__(self, bracelet_id, parent=None):
+        super().__init__(f"Bracelet {bracelet_id}", parent)
+        layout = QVBoxLayout(self)
+        self.status_label = QLabel("Everything is fine", self)
+        self.status_label.setStyleSheet("color: green; font-weight: bold;")
+        layout.addWidget(self.status_label)
+        self.metric_labels = {}
+        for metric in METRICS:
+            label = QLabel(f"{METRIC_LABELS[metric]}: N/A", self)
+            layout.addWidget(label)
+            self.metric_labels[metric] = label
+
+    def show_value(self, metric, value):
+        self.metric_labels[metric].setText(f"{METRIC_LABELS[metric]}: {value}")
+
+    def show_emergency(self, metrics):
+        if metrics:
+            self.status_label.setText("Emergency: " + ", ".join(METRIC_LABELS[metric] for metric in sorted(metrics)))
+            self.status_label.setStyleSheet("color: red; font-weight: bold;")
+        else:
+            self.status_label.setText("Everything is fine")
+            self.status_label.setStyleSheet("color: green; font-weight: bold;")
 
 
 class MainWindow(QMainWindow):
@@ -218,7 +220,11 @@ class MainWindow(QMainWindow):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.mc = MqttClient()
-        self.setGeometry(50, 50, 400, 600)
+        self.bridge = GuiBridge(gui_fps, self)
+        self.bridge.flushed.connect(self.apply_updates)
+        self.mc.set_bridge(self.bridge)
+        gauge("gui_pending_updates", lambda: len(self.bridge.pending))
+        self.setGeometry(50, 50, 600, 600)
         self.setWindowTitle('SmartPhone Health Monitor')
 
         # Main central widget and layout
@@ -231,17 +237,11 @@ class MainWindow(QMainWindow):
         self.emergency_label.setStyleSheet("font-size: 16px;")
         main_layout.addWidget(self.emergency_label)
 
-        # Display labels for each health metric
-        self.heart_rate_label = QLabel("Latest Heart Rate: N/A", self)
-        self.body_temp_label = QLabel("Latest Body Temp: N/A", self)
-        self.oxygen_label = QLabel("Latest Oxygen Level: N/A", self)
-        self.sugar_label = QLabel("Latest Blood Sugar: N/A", self)
-        
-        # Add health metric labels to layout
-        main_layout.addWidget(self.heart_rate_label)
-        main_layout.addWidget(self.body_temp_label)
-        main_layout.addWidget(self.oxygen_label)
-        main_layout.addWidget(self.sugar_label)
+        # Paired patients side by side
+        self.panels = {}  # bracelet_id -> PatientPanel
+        self.in_emergency = set()  # Paired bracelets last shown in emergency
+        self.panels_layout = QHBoxLayout()
+        main_layout.addLayout(self.panels_layout)
 
         # Save Log Button
         self.save_log_button = QPushButton("Save Log", self)
@@ -251,34 +251,70 @@ class MainWindow(QMainWindow):
 
         # Smartphone interface dock widget
         self.smartphoneInterface = SmartPhoneInterface(self.mc)
+        self.smartphoneInterface.ePairBtn.clicked.connect(self.on_pair_click)
+        self.smartphoneInterface.eUnpairBtn.clicked.connect(self.on_unpair_click)
         self.addDockWidget(Qt.TopDockWidgetArea, self.smartphoneInterface)
+        for bracelet_id in PAIRED_AT_START:
+            self.pair(bracelet_id)
+
+    def pair(self, bracelet_id):
+        if bracelet_id in self.panels:
+            return
+        self.mc.pair(bracelet_id)
+        panel = PatientPanel(bracelet_id, self)
+        self.panels[bracelet_id] = panel
+        self.panels_layout.addWidget(panel)
+
+    def unpair(self, bracelet_id):
+        panel = self.panels.pop(bracelet_id, None)
+        if panel is None:
+            return
+        self.mc.unpair(bracelet_id)
+        self.panels_layout.removeWidget(panel)
+        panel.deleteLater()
+        self.update_emergency_status()
+
+    def on_pair_click(self):
+        bracelet_id = self.smartphoneInterface.eBraceletID.text().strip()
+        if bracelet_id:
+            self.pair(bracelet_id)
+
+    def on_unpair_click(self):
+        self.unpair(self.smartphoneInterface.eBraceletID.text().strip())
+
+    @timed("gui_apply_updates")
+    def apply_updates(self, readings, events):
+        """Runs in the GUI thread with the updates coalesced since the last frame."""
+        for (bracelet_id, metric), value in readings.items():
+            panel = self.panels.get(bracelet_id)
+            if panel is not None:
+                panel.show_value(metric, value)
+        if "emergency" in events:
+            self.update_emergency_status()
 
     def update_emergency_status(self):
-        """Update the emergency label based on the client's health status and save logs if emergency occurs."""
+        """Update the emergency labels from the paired bracelets' alerts; save the logs when one enters an emergency."""
+        in_emergency = set()
+        for bracelet_id, panel in self.panels.items():
+            metrics = self.mc.emergencies.get(bracelet_id)
+            panel.show_emergency(metrics)
+            if metrics:
+                in_emergency.add(bracelet_id)
+        # Only a bracelet going from normal to emergency saves the logs, not another metric clearing or an unpair
+        entered = in_emergency - self.in_emergency
+        self.in_emergency = in_emergency
+        if entered:
+            log.info("Emergency detected on bracelet %s, saving logs...", ", ".join(sorted(entered)))
+            self.save_logs()
         if self.mc.emergency_status:
             self.emergency_label.setText("Emergency: Yes")
             self.emergency_label.setStyleSheet("color: red; font-weight: bold; font-size: 16px;")
-            print("Emergency detected, saving logs...")
-            self.save_logs()  # Automatically save logs when an emergency is detected
         else:
             self.emergency_label.setText("Emergency: Everything is fine")
             self.emergency_label.setStyleSheet("color: green; font-weight: bold; font-size: 16px;")
 
-    # Methods to update display labels with the latest metric values
-    def update_heart_rate_display(self):
-        self.heart_rate_label.setText(f"Latest Heart Rate: {self.mc.latest_heart_rate}")
-
-    def update_body_temp_display(self):
-        self.body_temp_label.setText(f"Latest Body Temp: {self.mc.latest_body_temp}")
-
-    def update_oxygen_display(self):
-        self.oxygen_label.setText(f"Latest Oxygen Level: {self.mc.latest_oxygen}")
-
-    def update_sugar_display(self):
-        self.sugar_label.setText(f"Latest Blood Sugar: {self.mc.latest_sugar}")
-
     def save_logs(self):
-        print("Saving logs...")  # Print to confirm button is working
+        log.info("Saving logs...")  # Confirms the button is working
         self.mc.save_logs()
 
     def connect_to_broker(self):
@@ -287,7 +323,8 @@ class MainWindow(QMainWindow):
         self.mc.start_listening()
 
 
-
+setup_logging(log_level, log_levels)
+start_metrics("smartphone")
 app = QApplication(sys.argv)
 mainwin = MainWindow()
 mainwin.show()
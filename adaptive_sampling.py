@@ -0,0 +1,64 @@
+import time
+
+from bracelet_frame import METRICS
+
+
+class AdaptiveSampler:
+    """Decides which readings of a bracelet are worth publishing and how soon to sample again.
+
+    A metric is published when it moved by at least its deadband since it was
+    last published, when heartbeat_seconds passed since then (so subscribers
+    can tell a steady patient from a silent bracelet), or on every sample while
+    it is within its approach margin of an alert threshold. While any metric is
+    that close, next_interval() returns fast_interval instead of interval.
+    A deadband of 0 publishes every sample.
+    """
+
+    def __init__(self, rules, deadbands, heartbeat_seconds, interval, fast_interval, margins):
+        self.deadbands = deadbands
+        self.heartbeat_seconds = heartbeat_seconds
+        self.interval = interval
+        self.fast_interval = fast_interval
+        self.margins = margins
+        self.last = {}  # metric -> (value, time) last published
+        self.skipped = 0
+        self.set_rules(rules)
+
+    def set_rules(self, rules):
+        # Only threshold rules have a threshold to approach
+        self.thresholds = {rule.metric: rule for rule in rules if hasattr(rule, "crossed")}
+
+    def near_threshold(self, metric, value):
+        """True if value is past its metric's threshold or within the approach margin of it."""
+        rule = self.thresholds.get(metric)
+        if rule is None:
+            return False
+        distance = value - rule.threshold if rule.below else rule.threshold - value
+        return distance <= self.margins.get(metric, 0)
+
+    def select(self, values, now=None, whole=False):
+        """Return the metrics of values (in METRICS order) to publish now and remember them as published.
+
+        With whole, any metric that is due selects them all, as they travel in one packed frame.
+        """
+        if now is None:
+            now = time.monotonic()
+        last = self.last
+        selected = []
+        for metric, value in zip(METRICS, values):
+            published = last.get(metric)
+            if (published is None or abs(value - published[0]) >= self.deadbands.get(metric, 0)
+                    or now - published[1] >= self.heartbeat_seconds or self.near_threshold(metric, value)):
+                selected.append(metric)
+        if whole and selected:
+            selected = list(METRICS)
+        for metric, value in zip(METRICS, values):
+            if metric in selected:
+                last[metric] = (value, now)
+        self.skipped += len(METRICS) - len(selected)
+        return selected
+
+    def next_interval(self, values):
+        if any(self.near_threshold(metric, value) for metric, value in zip(METRICS, values)):
+            return self.fast_interval
+        return self.interval
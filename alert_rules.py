@@ -0,0 +1,283 @@
+"""Alert rules for bracelet readings, loaded from alert_rules.json and reloaded when it changes.
+
+The file holds the ward-wide rules and optional groups of bracelets with their
+own rules; a group's rules replace the ward rules for the metrics they name:
+
+    {
+      "sustain_seconds": 10,
+      "rules": [
+        {"metric": "heart_rate", "above": 120, "alert": "Critical heart rate"},
+        {"metric": "oxygen", "below": 90, "hysteresis": 2, "alert": "Low oxygen level", "sustain_seconds": 5},
+        {"metric": "heart_rate", "rate_above": 3.0, "min_samples": 5, "alert": "Heart rate rising fast"}
+      ],
+      "groups": {
+        "cardiac": {"bracelets": ["12", "40"],
+                    "rules": [{"metric": "heart_rate", "above": 110, "alert": "Critical heart rate"}]}
+      }
+    }
+
+hysteresis is how far a value must come back past the threshold before a
+crossed threshold counts as clear again. Set $ALERT_RULES to use another file.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from bracelet_frame import METRICS
+from rolling_stats import RollingWindow
+
+log = logging.getLogger("alerts")
+
+ALERT_RULES_FILE = os.environ.get("ALERT_RULES",
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), "alert_rules.json"))
+
+
+class ThresholdRule:
+    """Fires when value is above (or below) a threshold and has stayed there for sustain_seconds.
+
+    Once crossed, the value has to come back past the threshold by hysteresis
+    before the rule resets, so a value hovering at the threshold does not flap.
+    """
+
+    def __init__(self, metric, threshold, alert, below=False, sustain_seconds=0, hysteresis=0):
+        self.metric = metric
+        self.threshold = float(threshold)
+        self.alert = alert
+        self.below = below
+        self.sustain_seconds = sustain_seconds
+        self.hysteresis = float(hysteresis)
+        # crossed(value) and cleared(value) are the float comparisons themselves, no Python-level call per reading
+        if below:
+            self.crossed = self.threshold.__gt__
+            self.cleared = (self.threshold + self.hysteresis).__lt__
+        else:
+            self.crossed = self.threshold.__lt__
+            self.cleared = (self.threshold - self.hysteresis).__gt__
+
+    def evaluate(self, window, since, ts, value):
+        """Return (fired, new rule state); the state is when the threshold was first crossed."""
+        if self.crossed(value):
+            if since is None:
+                since = ts
+        elif since is None or self.cleared(value):
+            return False, None
+        return ts - since >= self.sustain_seconds, since
+
+
+class RateOfChangeRule:
+    """Fires when the rolling slope passes max_rate units per second (use a negative rate for falling values)."""
+
+    def __init__(self, metric, max_rate, alert, min_samples=5):
+        self.metric = metric
+        self.max_rate = max_rate
+        self.alert = alert
+        self.min_samples = min_samples
+
+    def evaluate(self, window, state, ts, value):
+        if window.count < self.min_samples:
+            return False, None
+        slope = window.slope()
+        fired = slope < self.max_rate if self.max_rate < 0 else slope > self.max_rate
+        return fired, None
+
+
+class RuleSet:
+    """Rules compiled into per-metric dispatch tables, one for the ward and one per bracelet group.
+
+    rules_for() is two dict lookups however many rules and groups there are.
+    """
+
+    def __init__(self, rules, groups=None):
+        self.table = self.build_table(rules)
+        self.group_tables = {}     # group name -> table
+        self.bracelet_tables = {}  # bracelet_id -> table of its group
+        for name, (bracelet_ids, group_rules) in (groups or {}).items():
+            table = self.group_tables[name] = dict(self.table)
+            table.update(self.build_table(group_rules))
+            for bracelet_id in bracelet_ids:
+                if str(bracelet_id) in self.bracelet_tables:
+                    raise ValueError(f"bracelet {bracelet_id} is in more than one rule group")
+                self.bracelet_tables[str(bracelet_id)] = table
+        self.file_tables = dict(self.bracelet_tables)
+
+    @staticmethod
+    def build_table(rules):
+        table = {}
+        for rule in rules:
+            table[rule.metric] = table.get(rule.metric, ()) + (rule,)
+        return table
+
+    def set_profiles(self, profiles):
+        """Give each bracelet of {bracelet_id: group name} the rules of that group, over its group in the file.
+
+        Replaces the previous profiles; returns the group names that do not exist.
+        """
+        tables = dict(self.file_tables)
+        unknown = []
+        for bracelet_id, group in profiles.items():
+            table = self.group_tables.get(group)
+            if table is None:
+                unknown.append(group)
+            else:
+                tables[str(bracelet_id)] = table
+        self.bracelet_tables = tables  # One reference swap, like AlertEvaluator.set_rules
+        return unknown
+
+    def rules_for(self, bracelet_id, metric):
+        return self.bracelet_tables.get(bracelet_id, self.table).get(metric, ())
+
+    def rules_of(self, bracelet_id):
+        """Every rule that applies to one bracelet."""
+        table = self.bracelet_tables.get(str(bracelet_id), self.table)
+        return [rule for rules in table.values() for rule in rules]
+
+
+class AlertEvaluator:
+    """Keeps a RollingWindow per (bracelet, metric) and runs that metric's rules on every reading.
+
+    Not thread-safe: call evaluate() from the MQTT network thread only.
+    set_rules() may be called from any thread; the windows are kept.
+    """
+
+    def __init__(self, rules, capacity=64):
+        self.capacity = capacity
+        self.ruleset = rules if isinstance(rules, RuleSet) else RuleSet(rules)
+        self.windows = {}    # (bracelet_id, metric) -> RollingWindow
+        self.states = {}     # (bracelet_id, metric) -> (rules, list with one state per rule)
+
+    def set_rules(self, ruleset):
+        # One reference swap: a reading is evaluated against the old or the new rules, never dropped
+        self.ruleset = ruleset
+
+    def window(self, bracelet_id, metric):
+        return self.windows.get((bracelet_id, metric))
+
+    def evaluate(self, bracelet_id, metric, value, ts=None):
+        """Add a reading; return the alert text of the first rule that fires, or None."""
+        if ts is None:
+            ts = time.monotonic()
+        key = (bracelet_id, metric)
+        rules = self.ruleset.rules_for(bracelet_id, metric)
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = RollingWindow(self.capacity)
+        window.add(ts, value)
+        entry = self.states.get(key)
+        if entry is None or entry[0] is not rules:
+            # First reading, or the rules were reloaded: start their states afresh
+            entry = self.states[key] = (rules, [None] * len(rules))
+        states = entry[1]
+        alert = None
+        for index, rule in enumerate(rules):
+            fired, states[index] = rule.evaluate(window, states[index], ts, value)
+            if fired and alert is None:
+                alert = rule.alert
+        return alert
+
+    def forget(self, bracelet_id):
+        """Drop the windows of a bracelet that left the ward."""
+        for metric in METRICS:
+            self.windows.pop((bracelet_id, metric), None)
+            self.states.pop((bracelet_id, metric), None)
+
+
+def compile_rule(spec, sustain_seconds):
+    if not isinstance(spec, dict):
+        raise ValueError(f"rule {spec!r} is not an object")
+    metric = spec.get("metric")
+    if metric not in METRICS:
+        raise ValueError(f"unknown metric in rule {spec}")
+    try:
+        alert = spec["alert"]
+        if "above" in spec or "below" in spec:
+            below = "below" in spec
+            return ThresholdRule(metric, spec["below" if below else "above"], alert, below=below,
+                                 sustain_seconds=float(spec.get("sustain_seconds", sustain_seconds)),
+                                 hysteresis=spec.get("hysteresis", 0))
+        if "rate_above" in spec or "rate_below" in spec:
+            max_rate = float(spec["rate_above"]) if "rate_above" in spec else -abs(float(spec["rate_below"]))
+            return RateOfChangeRule(metric, max_rate, alert, min_samples=int(spec.get("min_samples", 5)))
+    except (KeyError, TypeError, OverflowError) as error:
+        raise ValueError(f"bad rule {spec}: {error!r}") from None
+    raise ValueError(f"rule {spec} needs one of above, below, rate_above, rate_below")
+
+
+def list_field(spec, key, where):
+    """spec[key], or [] if it is missing; raises ValueError if it is not a list (a string is not a list of ids)."""
+    value = spec.get(key, [])
+    if not isinstance(value, list):
+        raise ValueError(f'"{key}" of {where} must be a list, not {value!r}')
+    return value
+
+
+def compile_rules(config):
+    """Build a RuleSet from the parsed contents of a rules file; raises ValueError if it has the wrong shape."""
+    if not isinstance(config, dict):
+        raise ValueError(f"the rules file must hold an object, not {config!r}")
+    try:
+        sustain_seconds = float(config.get("sustain_seconds", 0))
+    except (TypeError, ValueError):
+        raise ValueError(f"bad sustain_seconds {config['sustain_seconds']!r}") from None
+    rules = [compile_rule(spec, sustain_seconds) for spec in list_field(config, "rules", "the rules file")]
+    group_specs = config.get("groups", {})
+    if not isinstance(group_specs, dict):
+        raise ValueError(f'"groups" must be an object, not {group_specs!r}')
+    groups = {}
+    for name, group in group_specs.items():
+        if not isinstance(group, dict):
+            raise ValueError(f"rule group {name} is not an object")
+        group_rules = [compile_rule(spec, sustain_seconds) for spec in list_field(group, "rules", f"group {name}")]
+        bracelet_ids = list_field(group, "bracelets", f"group {name}")
+        for bracelet_id in bracelet_ids:
+            if not isinstance(bracelet_id, (str, int)):
+                raise ValueError(f"bad bracelet id {bracelet_id!r} in group {name}")
+        groups[name] = (bracelet_ids, group_rules)
+    return RuleSet(rules, groups)
+
+
+def load_rules(path=ALERT_RULES_FILE):
+    """Read and compile a rules file; raises OSError or ValueError if it is missing or invalid."""
+    with open(path) as file:
+        return compile_rules(json.load(file))
+
+
+class RuleReloader:
+    """Polls a rules file and hands every valid new version to on_reload(ruleset).
+
+    An invalid file is reported and the rules in use are kept.
+    """
+
+    def __init__(self, on_reload, path=ALERT_RULES_FILE, interval=2.0):
+        self.on_reload = on_reload
+        self.path = path
+        self.interval = interval
+        self.version = self.file_version()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="RuleReloader", daemon=True)
+        self.thread.start()
+
+    def file_version(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            version = self.file_version()
+            if version is None or version == self.version:
+                continue
+            self.version = version
+            try:
+                ruleset = load_rules(self.path)
+            except (OSError, ValueError) as error:
+                log.error("Keeping the current alert rules, %s is invalid: %s", self.path, error)
+                continue
+            self.on_reload(ruleset)
+            log.info("Reloaded alert rules from %s", self.path)
+
+    def stop(self):
+        self.stop_event.set()
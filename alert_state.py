@@ -0,0 +1,37 @@
+import time
+
+from bracelet_frame import METRICS
+
+
+class AlertTracker:
+    """Turns the alert result of every reading into raise and clear transitions.
+
+    Repeats of the active alert are swallowed, and an alert is only cleared
+    after hold_seconds without it firing, so the UI, logs and notifications
+    run once per real change instead of once per message. Only active alerts
+    are stored. Not thread-safe: call update() from the MQTT network thread.
+    """
+
+    def __init__(self, hold_seconds=15):
+        self.hold_seconds = hold_seconds
+        self.active = {}  # (bracelet_id, metric) -> (alert text, last time it fired)
+
+    def update(self, bracelet_id, metric, alert, ts=None):
+        """Return (alert held for this bracelet and metric or None, True if that changed)."""
+        if ts is None:
+            ts = time.monotonic()
+        key = (bracelet_id, metric)
+        held = self.active.get(key)
+        if alert is None:
+            if held is None:
+                return None, False
+            if ts - held[1] < self.hold_seconds:
+                return held[0], False
+            del self.active[key]
+            return None, True
+        self.active[key] = (alert, ts)
+        return alert, held is None or held[0] != alert
+
+    def forget(self, bracelet_id):
+        for metric in METRICS:
+            self.active.pop((bracelet_id, metric), None)
@@ -0,0 +1,73 @@
+"""Logging for the apps: records go through a queue and are written by a background thread.
+
+Categories are logger names ("mqtt", "mqtt.paho", "messages", "alerts", ...)
+with their own levels, so e.g. paho's debug output is dropped before it is
+even formatted. Per-message logging goes through MessageLog, which keeps
+counters and writes a summary line instead of one line per message.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener = None
+
+
+def setup_logging(level="INFO", levels=None, stream=None):
+    """Send every record through a queue to one writer thread; levels maps category -> level."""
+    global _listener
+    if _listener is not None:
+        return
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    for name, category_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(category_level)
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # Writes out whatever is still queued
+
+
+class MessageLog:
+    """Counts messages and logs "<verb> N messages (R msg/s)" every interval seconds.
+
+    With the logger at DEBUG, single messages are logged too, at most
+    max_per_second of them. Call add() from one thread (paho's network thread).
+    """
+
+    def __init__(self, logger, verb="Received", interval=5.0, max_per_second=10):
+        self.logger = logger
+        self.verb = verb
+        self.interval = interval
+        self.max_per_second = max_per_second
+        self.count = 0
+        self.last_count = 0
+        self.last_report = time.monotonic()
+        self.sample_window = 0.0
+        self.sampled = 0
+
+    def add(self, topic, payload):
+        self.count += 1
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.report(now, topic)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            if now >= self.sample_window:
+                self.sample_window = now + 1.0
+                self.sampled = 0
+            if self.sampled < self.max_per_second:
+                self.sampled += 1
+                self.logger.debug("Message from %s: %r", topic, payload)
+
+    def report(self, now, topic):
+        rate = (self.count - self.last_count) / (now - self.last_report)
+        self.logger.info("%s %d messages (%.0f msg/s), last from %s", self.verb, self.count, rate, topic)
+        self.last_count = self.count
+        self.last_report = now
@@ -0,0 +1,198 @@
+"""End-to-end latency and throughput benchmark on the in-process broker.
+
+Drives SmartBracelet-style publishers (FleetSimulator) at increasing rates
+through LocalBroker into Hospital- and Smartphone-style subscriber pipelines,
+then reports p50/p99 publish-to-on_message latency and the highest rate each
+subscriber kept up with as JSON. No network or MQTT broker is needed.
+
+Usage: python bench_latency.py [--rates 1000,2000,5000] [--duration 3] [--packed] [--output results.json]
+"""
+import argparse
+import json
+import sys
+import time
+
+from alert_rules import AlertEvaluator, load_rules
+from alert_state import AlertTracker
+from emergency_state import EmergencyStateTable
+from fleet_simulator import FleetSimulator
+from local_broker import LocalBroker, LocalClient
+from mqtt_init import alert_hold_seconds
+from topic_router import TopicRouter
+
+BRACELET_TOPIC = 'smartbracelet/#'
+
+
+def hospital_router():
+    """The alert processing of Hospital.MqttClient: rules, alert holds and the per-bracelet emergency table.
+
+    Leaves out the vitals store and the GUI.
+    """
+    evaluator = AlertEvaluator(load_rules())
+    tracker = AlertTracker(alert_hold_seconds)
+    state = EmergencyStateTable()
+    router = TopicRouter()
+
+    def check_emergency_status(bracelet_id, metric, value):
+        alert, changed = tracker.update(bracelet_id, metric, evaluator.evaluate(bracelet_id, metric, value))
+        state.update(bracelet_id, metric, alert is not None)
+
+    router.register_all(check_emergency_status)
+    return router
+
+
+def smartphone_router():
+    """The alert processing of Smartphone.MqttClient: rules, alert holds and the latest value per metric."""
+    evaluator = AlertEvaluator(load_rules())
+    tracker = AlertTracker(alert_hold_seconds)
+    latest = {}
+    emergencies = {}
+    router = TopicRouter()
+
+    def check_critical_values(bracelet_id, metric, value):
+        alert, changed = tracker.update(bracelet_id, metric, evaluator.evaluate(bracelet_id, metric, value))
+        if changed:
+            metrics = emergencies.get(bracelet_id, frozenset())
+            emergencies[bracelet_id] = metrics | {metric} if alert is not None else metrics - {metric}
+
+    def update_latest_value(bracelet_id, metric, value):
+        latest[metric] = value
+
+    router.register_all(check_critical_values)
+    router.register_all(update_latest_value)
+    return router
+
+
+class SubscriberProbe:
+    """Subscriber that runs a message pipeline and records publish-to-on_message latency."""
+
+    def __init__(self, name, broker, router):
+        self.name = name
+        self.router = router
+        self.latencies = []
+        self.client = LocalClient(name, broker=broker)
+        self.client.on_message = self.on_message
+
+    def start(self):
+        self.client.connect()
+        self.client.subscribe(BRACELET_TOPIC)
+        self.client.loop_start()
+
+    def stop(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def on_message(self, client, userdata, msg):
+        self.router.dispatch(msg.topic, msg.payload)
+        self.latencies.append(time.perf_counter() - msg.timestamp)
+
+    def received(self):
+        return len(self.latencies)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run_step(rate, duration, packed, bracelets, connections, drain_timeout):
+    broker = LocalBroker()
+    probes = [
+        SubscriberProbe("hospital", broker, hospital_router()),
+        SubscriberProbe("smartphone", broker, smartphone_router()),
+    ]
+    for probe in probes:
+        probe.start()
+
+    publishers = [LocalClient(f"bracelets-{index}", broker=broker) for index in range(connections)]
+    messages_per_tick = 1 if packed else 4
+    interval = bracelets * messages_per_tick / rate
+    simulator = FleetSimulator(publishers, range(1, bracelets + 1), interval, packed)
+
+    start = time.perf_counter()
+    simulator.start()
+    time.sleep(duration)
+    simulator.stop()
+    elapsed = time.perf_counter() - start
+    sent = simulator.published()
+    backlog_at_stop = {probe.name: sent - probe.received() for probe in probes}
+
+    # Let the subscribers drain so every sent message gets a latency sample
+    deadline = time.perf_counter() + drain_timeout
+    while time.perf_counter() < deadline and any(probe.received() < sent for probe in probes):
+        time.sleep(0.01)
+    for probe in probes:
+        probe.stop()
+
+    publish_rate = sent / elapsed
+    step = {
+        "target_rate": rate,
+        "publish_rate": round(publish_rate, 1),
+        "sent": sent,
+        "late_ticks": sum(simulator.late_ticks),
+        "subscribers": {},
+    }
+    for probe in probes:
+        latencies = sorted(probe.latencies)
+        backlog = backlog_at_stop[probe.name]
+        step["subscribers"][probe.name] = {
+            "received": len(latencies),
+            "backlog_at_stop": backlog,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+            "max_ms": round(latencies[-1] * 1000, 3) if latencies else None,
+            # Kept up: publishers hit the target rate and the subscriber finished the
+            # run with at most 1% of the messages still queued
+            "kept_up": publish_rate >= 0.9 * rate and backlog <= max(10, 0.01 * sent),
+        }
+    return step
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish-to-on_message latency and throughput benchmark.")
+    parser.add_argument("--rates", default="500,1000,2000,5000,10000,20000,50000",
+                        help="comma separated target message rates (msg/s)")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per rate step")
+    parser.add_argument("--bracelets", type=int, default=1000, help="number of virtual bracelets")
+    parser.add_argument("--connections", type=int, default=4, help="publisher connections")
+    parser.add_argument("--packed", action="store_true", help="publish packed frames instead of text messages")
+    parser.add_argument("--drain-timeout", type=float, default=10.0, help="seconds to wait for subscribers to drain")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    rates = [int(rate) for rate in args.rates.split(",")]
+    steps = []
+    max_sustained = {"hospital": 0, "smartphone": 0}
+    for rate in rates:
+        step = run_step(rate, args.duration, args.packed, args.bracelets, args.connections, args.drain_timeout)
+        steps.append(step)
+        print(f"rate {rate} msg/s: " + ", ".join(
+            f"{name} p50 {result['p50_ms']} ms p99 {result['p99_ms']} ms kept up {result['kept_up']}"
+            for name, result in step["subscribers"].items()), file=sys.stderr)
+        for name, result in step["subscribers"].items():
+            if result["kept_up"]:
+                max_sustained[name] = max(max_sustained[name], rate)
+        if not any(result["kept_up"] for result in step["subscribers"].values()):
+            break  # Higher rates will not do better
+
+    results = {
+        "benchmark": "bracelet_to_subscriber_latency",
+        "broker": "local_in_process",
+        "packed": args.packed,
+        "bracelets": args.bracelets,
+        "connections": args.connections,
+        "duration_s": args.duration,
+        "steps": steps,
+        "max_sustained_rate": max_sustained,
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Messages per second of the legacy substring dispatch vs. the TopicRouter.
+
+Both run the same per-metric threshold check, taken from alert_rules.json.
+
+Usage: python bench_router.py [messages] [bracelets]
+"""
+import random
+import sys
+import time
+
+from alert_rules import load_rules
+from bracelet_metrics import METRIC_LABELS
+from topic_router import METRICS, TopicRouter
+
+
+def threshold_checks():
+    """crossed(value) of each metric's ward-wide threshold rule in alert_rules.json."""
+    ruleset = load_rules()
+    return {metric: rule.crossed for metric in METRICS
+            for rule in ruleset.rules_for(None, metric) if hasattr(rule, "crossed")}
+
+
+def make_messages(count, bracelets):
+    messages = []
+    for _ in range(count):
+        metric = random.choice(METRICS)
+        topic = f"smartbracelet/{random.randrange(1, bracelets + 1)}/{metric}"
+        payload = f"{METRIC_LABELS[metric]}: {round(random.uniform(36, 300), 2)}".encode("utf-8")
+        messages.append((topic, payload))
+    return messages
+
+
+def legacy_dispatch(topic, payload, record, crossed):
+    # Mirrors the original check_emergency_status substring chain
+    message = str(payload.decode("utf-8"))
+    bracelet_id = topic.split("/")[1]
+    if "body_temp" in topic:
+        value = float(message.split(": ")[1])
+        record(bracelet_id, "body_temp", crossed["body_temp"](value))
+    elif "heart_rate" in topic:
+        value = float(message.split(": ")[1])
+        record(bracelet_id, "heart_rate", crossed["heart_rate"](value))
+    elif "oxygen" in topic:
+        value = float(message.split(": ")[1])
+        record(bracelet_id, "oxygen", crossed["oxygen"](value))
+    elif "sugar" in topic:
+        value = float(message.split(": ")[1])
+        record(bracelet_id, "sugar", crossed["sugar"](value))
+
+
+def best_rate(run, messages, repeats):
+    best = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run(messages)
+        best = max(best, len(messages) / (time.perf_counter() - start))
+    return best
+
+
+def run_legacy(messages):
+    state = {}
+    crossed = threshold_checks()
+
+    def record(bracelet_id, metric, critical):
+        state[(bracelet_id, metric)] = critical
+
+    for topic, payload in messages:
+        legacy_dispatch(topic, payload, record, crossed)
+
+
+def run_router(messages):
+    state = {}
+    crossed = threshold_checks()
+
+    def evaluate(bracelet_id, metric, value):
+        state[(bracelet_id, metric)] = crossed[metric](value)
+
+    router = TopicRouter()
+    router.register_all(evaluate)
+    dispatch = router.dispatch
+    for topic, payload in messages:
+        dispatch(topic, payload)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    bracelets = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    repeats = 5
+    messages = make_messages(count, bracelets)
+    legacy_rate = best_rate(run_legacy, messages, repeats)
+    router_rate = best_rate(run_router, messages, repeats)
+    print(f"{count} messages from {bracelets} bracelets, best of {repeats} runs")
+    print(f"legacy substring dispatch: {legacy_rate:,.0f} msg/s")
+    print(f"topic router:              {router_rate:,.0f} msg/s ({router_rate / legacy_rate:.2f}x)")
@@ -0,0 +1,59 @@
+"""Startup time of the shared configuration: import mqtt_init and resolve the broker.
+
+Each run uses a fresh interpreter, like the processes started by runAll.py.
+Prints JSON; with --max-import-ms the exit code is 1 when the median import
+time is over budget, so a slow import (e.g. DNS at import time) is caught.
+
+Usage: python bench_startup.py [--runs 10] [--max-import-ms 50]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import time
+start = time.perf_counter()
+import mqtt_init
+imported = time.perf_counter()
+host = mqtt_init.resolve_broker()
+resolved = time.perf_counter()
+print((imported - start) * 1000, (resolved - imported) * 1000, host != mqtt_init.broker_host)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure mqtt_init import and broker resolution time.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-import-ms", type=float, help="fail if the median import time is above this")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    import_ms = []
+    resolve_ms = []
+    resolved = 0
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, "-c", PROBE], cwd=here, capture_output=True, text=True, check=True)
+        imported, resolving, ok = output.stdout.split()[-3:]
+        import_ms.append(float(imported))
+        resolve_ms.append(float(resolving))
+        resolved += ok == "True"
+
+    results = {
+        "benchmark": "startup",
+        "runs": args.runs,
+        "import_ms_p50": round(statistics.median(import_ms), 3),
+        "import_ms_max": round(max(import_ms), 3),
+        "resolve_ms_p50": round(statistics.median(resolve_ms), 3),
+        "resolve_ms_max": round(max(resolve_ms), 3),
+        "resolved_runs": resolved,
+    }
+    print(json.dumps(results, indent=2))
+    if args.max_import_ms is not None and results["import_ms_p50"] > args.max_import_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import json
+import struct
+import zlib
+
+# One frame per tick carries every metric of a bracelet:
+# smartbracelet/{bracelet_id}/frame
+FRAME_METRIC = "frame"
+# Retained copy of a bracelet's latest frame for subscribers that just connected:
+# smartbracelet/{bracelet_id}/snapshot
+SNAPSHOT_METRIC = "snapshot"
+# A bracelet announcing its device id when it connects: smartbracelet/{bracelet_id}/register
+REGISTER_METRIC = "register"
+# Readings a bracelet queued while offline, one frame per sample with its own timestamp
+# and NaN for the metrics that were published live: smartbracelet/{bracelet_id}/replay
+REPLAY_METRIC = "replay"
+METRICS = ("body_temp", "heart_rate", "oxygen", "sugar")  # Field order inside a frame
+
+# magic, version, reserved, sequence number, timestamp, then one float32 per metric
+# in METRICS order (body_temp, heart_rate, oxygen, sugar) - 32 bytes in total
+FRAME_MAGIC = 0x42
+FRAME_VERSION = 1
+FRAME_STRUCT = struct.Struct("<BBHId" + "f" * len(METRICS))
+FRAME_SIZE = FRAME_STRUCT.size
+
+
+def encode_frame(values, seq, timestamp, fmt="struct"):
+    """Pack the metric values (in METRICS order) into one frame payload.
+
+    fmt is "struct" for the fixed binary layout or "json" for a readable frame.
+    """
+    if fmt == "json":
+        frame = {"seq": seq, "ts": timestamp}
+        frame.update(zip(METRICS, values))
+        return json.dumps(frame, separators=(",", ":")).encode("utf-8")
+    return FRAME_STRUCT.pack(FRAME_MAGIC, FRAME_VERSION, 0, seq & 0xFFFFFFFF, timestamp, *values)
+
+
+def decode_frame(payload):
+    """Return (seq, timestamp, values) from a struct or JSON frame payload."""
+    if payload[:1] == b"{":
+        frame = json.loads(payload)
+        try:
+            return int(frame["seq"]), float(frame["ts"]), tuple(float(frame[metric]) for metric in METRICS)
+        except (TypeError, OverflowError) as error:  # e.g. a null value or 1e400; callers only expect ValueError
+            raise ValueError(f"Bad frame field: {error}") from None
+    if len(payload) != FRAME_SIZE:
+        raise ValueError(f"Bad frame size {len(payload)}, expected {FRAME_SIZE}")
+    magic, version, _, seq, timestamp, *values = FRAME_STRUCT.unpack(payload)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError("Not a bracelet frame")
+    return seq, timestamp, _round_values(values)
+
+
+def _round_values(values):
+    # float32 is exact to ~1e-5 for vitals ranges, so rounding to 4 decimals
+    # gives back the values the bracelet measured (it reports 2 decimals)
+    return tuple(round(value, 4) for value in values)
+
+
+# Fleet snapshot: the latest values of every bracelet in one zlib-compressed message
+# header: magic, version, entry count; each entry: id length, id, timestamp, one float32 per metric
+FLEET_MAGIC = 0x46
+FLEET_VERSION = 1
+FLEET_HEADER = struct.Struct("<BBI")
+FLEET_ENTRY = struct.Struct("<d" + "f" * len(METRICS))
+
+
+def encode_fleet_snapshot(entries):
+    """Pack [(bracelet_id, timestamp, values)] into one fleet snapshot payload."""
+    parts = [FLEET_HEADER.pack(FLEET_MAGIC, FLEET_VERSION, len(entries))]
+    for bracelet_id, timestamp, values in entries:
+        bracelet_id = bracelet_id.encode("utf-8")
+        parts.append(bytes((len(bracelet_id),)) + bracelet_id + FLEET_ENTRY.pack(timestamp, *values))
+    return zlib.compress(b"".join(parts), 1)
+
+
+def decode_fleet_snapshot(payload):
+    """Return [(bracelet_id, timestamp, values)] from a fleet snapshot payload."""
+    try:
+        blob = zlib.decompress(payload)
+        magic, version, count = FLEET_HEADER.unpack_from(blob)
+        if magic != FLEET_MAGIC or version != FLEET_VERSION:
+            raise ValueError("Not a fleet snapshot")
+        entries = []
+        offset = FLEET_HEADER.size
+        for _ in range(count):
+            length = blob[offset]
+            bracelet_id = blob[offset + 1:offset + 1 + length].decode("utf-8")
+            offset += 1 + length
+            timestamp, *values = FLEET_ENTRY.unpack_from(blob, offset)
+            offset += FLEET_ENTRY.size
+            entries.append((bracelet_id, timestamp, _round_values(values)))
+    except (zlib.error, struct.error, IndexError) as error:
+        raise ValueError(f"Bad fleet snapshot: {error}")
+    return entries
@@ -0,0 +1,66 @@
+import random
+
+from bracelet_frame import FRAME_METRIC, METRICS, REGISTER_METRIC, REPLAY_METRIC, SNAPSHOT_METRIC
+
+# Label used in the legacy text payload of each metric, e.g. 'Heart Rate: 80.5'
+METRIC_LABELS = {
+    "body_temp": "Body Temperature",
+    "heart_rate": "Heart Rate",
+    "oxygen": "Oxygen Level",
+    "sugar": "Blood Sugar",
+}
+
+
+# Simulated range of each metric, in METRICS order
+READING_RANGES = ((36, 42), (60, 150), (85, 100), (80, 300))
+DRIFT = 0.01  # largest step of drift_readings() as a fraction of the range
+
+
+def generate_readings():
+    """Generate random health metric values (in METRICS order) to simulate real data."""
+    return tuple(round(random.uniform(low, high), 2) for low, high in READING_RANGES)
+
+
+def drift_readings(previous):
+    """Like generate_readings(), but each value takes a small random step from previous, like a real patient."""
+    return tuple(round(min(high, max(low, value + random.uniform(-DRIFT, DRIFT) * (high - low))), 2)
+                 for value, (low, high) in zip(previous, READING_RANGES))
+
+
+def bracelet_order(bracelet_id):
+    """Sort key putting numeric bracelet ids in numeric order, without parsing them."""
+    return len(bracelet_id), bracelet_id
+
+
+def metric_topic(bracelet_id, metric):
+    return f'smartbracelet/{bracelet_id}/{metric}'
+
+
+def bracelet_topic(bracelet_id):
+    """Subscription filter for every message of one bracelet."""
+    return f'smartbracelet/{bracelet_id}/#'
+
+
+def metric_topics(bracelet_id):
+    """Return the legacy per-metric topics of a bracelet in METRICS order."""
+    return tuple(metric_topic(bracelet_id, metric) for metric in METRICS)
+
+
+def frame_topic(bracelet_id):
+    return metric_topic(bracelet_id, FRAME_METRIC)
+
+
+def snapshot_topic(bracelet_id):
+    return metric_topic(bracelet_id, SNAPSHOT_METRIC)
+
+
+def register_topic(bracelet_id):
+    return metric_topic(bracelet_id, REGISTER_METRIC)
+
+
+def replay_topic(bracelet_id):
+    return metric_topic(bracelet_id, REPLAY_METRIC)
+
+
+def text_payload(metric, value):
+    return f'{METRIC_LABELS[metric]}: {value}'
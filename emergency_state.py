@@ -0,0 +1,40 @@
+import threading
+
+
+class EmergencyStateTable:
+    """Critical flag for every (bracelet, metric) pair.
+
+    Each update is O(1) and keeps the set of currently critical bracelets up
+    to date incrementally, so the dashboard never has to scan every patient.
+    """
+
+    def __init__(self):
+        self.critical_metrics = {}   # bracelet_id -> set of metrics over threshold
+        self.critical_bracelets = set()
+        self.lock = threading.Lock()
+
+    def update(self, bracelet_id, metric, critical):
+        """Record whether a metric is critical and return True if the bracelet's emergency state changed."""
+        with self.lock:
+            metrics = self.critical_metrics.get(bracelet_id)
+            if critical:
+                if metrics is None:
+                    self.critical_metrics[bracelet_id] = {metric}
+                    self.critical_bracelets.add(bracelet_id)
+                    return True
+                metrics.add(metric)
+            elif metrics is not None:
+                metrics.discard(metric)
+                if not metrics:
+                    del self.critical_metrics[bracelet_id]
+                    self.critical_bracelets.discard(bracelet_id)
+                    return True
+            return False
+
+    def is_emergency(self):
+        return bool(self.critical_bracelets)
+
+    def critical_snapshot(self):
+        """Return {bracelet_id: sorted critical metrics} for the critical bracelets only."""
+        with self.lock:
+            return {bracelet_id: sorted(metrics) for bracelet_id, metrics in self.critical_metrics.items()}
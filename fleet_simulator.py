@@ -0,0 +1,155 @@
+"""Headless fleet simulator: many virtual bracelets published over a few MQTT connections.
+
+Usage: python fleet_simulator.py --bracelets 2000 --connections 8 --interval 5
+"""
+import argparse
+import random
+import threading
+import time
+
+from bracelet_frame import METRICS, encode_frame
+from bracelet_metrics import frame_topic, generate_readings, metric_topics, snapshot_topic, text_payload
+
+
+class VirtualBracelet:
+    """One simulated bracelet using the same metrics and topics as SmartBracelet.py."""
+
+    def __init__(self, bracelet_id):
+        self.bracelet_id = bracelet_id
+        self.topics = metric_topics(bracelet_id)
+        self.frame_topic = frame_topic(bracelet_id)
+        self.snapshot_topic = snapshot_topic(bracelet_id)
+        self.seq = 0
+
+    def messages(self, packed=False, fmt="struct", retained=False):
+        """Return the (topic, payload, retain) messages of one tick.
+
+        With retained, the broker keeps the latest values for new subscribers like
+        SmartBracelet.py does: the frame itself, or a snapshot frame next to the text.
+        """
+        values = generate_readings()
+        self.seq += 1
+        if packed:
+            return [(self.frame_topic, encode_frame(values, self.seq, time.time(), fmt), retained)]
+        messages = [(topic, text_payload(metric, value), False) for topic, metric, value in zip(self.topics, METRICS, values)]
+        if retained:
+            messages.append((self.snapshot_topic, encode_frame(values, self.seq, time.time()), True))
+        return messages
+
+
+class FleetSimulator:
+    """Multiplex virtual bracelets over a small pool of connected MQTT clients.
+
+    Bracelets are spread round-robin over the clients and every client gets one
+    publisher thread that spaces its bracelets evenly over the tick interval,
+    so the broker sees a steady rate instead of a burst every interval.
+    """
+
+    def __init__(self, clients, bracelet_ids, interval=5.0, packed=False, fmt="struct", retained=False):
+        self.clients = clients
+        self.interval = interval
+        self.packed = packed
+        self.fmt = fmt
+        self.retained = retained
+        self.groups = [[] for _ in clients]
+        for index, bracelet_id in enumerate(bracelet_ids):
+            self.groups[index % len(clients)].append(VirtualBracelet(bracelet_id))
+        self.counts = [0] * len(clients)      # Messages published, one slot per thread
+        self.late_ticks = [0] * len(clients)  # Ticks skipped because a thread fell behind
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for index in range(len(self.clients)):
+            thread = threading.Thread(target=self.run_group, args=(index,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def published(self):
+        return sum(self.counts)
+
+    def run_group(self, index):
+        client = self.clients[index]
+        bracelets = self.groups[index]
+        if not bracelets:
+            return
+        step = self.interval / len(bracelets)
+        next_due = time.perf_counter() + random.uniform(0, step)
+        while not self.stop_event.is_set():
+            for bracelet in bracelets:
+                delay = next_due - time.perf_counter()
+                if delay > 0:
+                    if self.stop_event.wait(delay):
+                        return
+                elif -delay > self.interval:
+                    # More than a whole tick behind: drop the backlog instead of bursting
+                    self.late_ticks[index] += 1
+                    next_due = time.perf_counter()
+                messages = bracelet.messages(self.packed, self.fmt, self.retained)
+                for topic, payload, retain in messages:
+                    client.publish(topic, payload, retain=retain)
+                self.counts[index] += len(messages)
+                next_due += step
+
+
+def connect_clients(count, prefix):
+    """Open count paho connections to the configured broker, each with its own network loop."""
+    # paho and the broker settings are only needed when talking to a real broker
+    from mqtt_client import KEEPALIVE, create_client
+    from mqtt_init import resolve_broker, broker_port
+
+    broker = resolve_broker()
+    clients = []
+    for index in range(count):
+        client = create_client(f"{prefix}-{index}")
+        client.connect(broker, int(broker_port), KEEPALIVE)
+        client.loop_start()
+        clients.append(client)
+    return clients
+
+
+def main():
+    from mqtt_init import packed_frames, frame_format, retained_snapshots
+
+    parser = argparse.ArgumentParser(description="Simulate a fleet of smart bracelets without a GUI.")
+    parser.add_argument("--bracelets", type=int, default=100, help="number of virtual bracelets")
+    parser.add_argument("--first-id", type=int, default=1, help="id of the first virtual bracelet")
+    parser.add_argument("--connections", type=int, default=4, help="MQTT connections shared by the bracelets")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between ticks of one bracelet")
+    parser.add_argument("--packed", action="store_true", default=packed_frames, help="publish one packed frame per tick")
+    parser.add_argument("--no-retain", dest="retained", action="store_false", default=retained_snapshots,
+                        help="do not keep retained snapshots on the broker")
+    parser.add_argument("--duration", type=float, default=0, help="seconds to run, 0 runs until Ctrl+C")
+    args = parser.parse_args()
+
+    connections = max(1, min(args.connections, args.bracelets))
+    clients = connect_clients(connections, "IOT_fleet-" + str(random.randrange(1, 10000000)))
+    bracelet_ids = range(args.first_id, args.first_id + args.bracelets)
+    simulator = FleetSimulator(clients, bracelet_ids, args.interval, args.packed, frame_format, args.retained)
+    print(f"Simulating {args.bracelets} bracelets over {connections} connections, one tick every {args.interval}s")
+    simulator.start()
+
+    start = time.perf_counter()
+    last_count = 0
+    try:
+        while not args.duration or time.perf_counter() - start < args.duration:
+            time.sleep(5)
+            count = simulator.published()
+            print(f"Published {count} messages ({(count - last_count) / 5:.0f} msg/s), late ticks: {sum(simulator.late_ticks)}")
+            last_count = count
+    except KeyboardInterrupt:
+        pass
+    simulator.stop()
+    for client in clients:
+        client.loop_stop()
+        client.disconnect()
+
+
+if __name__ == "__main__":
+    main()
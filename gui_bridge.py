@@ -0,0 +1,52 @@
+import threading
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+
+class GuiBridge(QObject):
+    """Carry readings from the MQTT network thread to the Qt main thread.
+
+    post() and notify() are called from paho's network thread and only record
+    the newest value per (bracelet_id, metric) or the name of an event under a
+    lock. A QTimer in the GUI thread flushes the coalesced batch through the
+    flushed signal at most max_fps times a second, so the network thread never
+    touches a widget and a burst of messages costs one repaint.
+    Create the bridge in the GUI thread.
+    """
+
+    flushed = pyqtSignal(object, object)  # {(bracelet_id, metric): value}, set of event names
+
+    def __init__(self, max_fps=20, parent=None):
+        super().__init__(parent)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.events = set()
+        self.posted = 0
+        self.coalesced = 0
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start(max(1, int(1000 / max_fps)))
+
+    def post(self, bracelet_id, metric, value):
+        key = (bracelet_id, metric)
+        with self.lock:
+            self.posted += 1
+            if key in self.pending:
+                self.coalesced += 1
+            self.pending[key] = value
+
+    def notify(self, event):
+        with self.lock:
+            self.events.add(event)
+
+    def flush(self):
+        with self.lock:
+            if not self.pending and not self.events:
+                return
+            readings, self.pending = self.pending, {}
+            events, self.events = self.events, set()
+        self.flushed.emit(readings, events)
+
+    def stop(self):
+        self.timer.stop()
+        self.flush()
@@ -0,0 +1,127 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+
+class HealthLogWriter:
+    """Append-only JSON lines health log written by a background thread.
+
+    write() only puts the record on a bounded queue, so callers on the MQTT
+    network thread never wait for the disk. The writer thread writes records
+    in batches, fsyncs at most once per fsync_interval and rotates the file
+    by size or age (path.1 is the newest backup). Records still queued are
+    written when the writer is closed, which also happens at interpreter exit.
+    """
+
+    def __init__(self, path, max_queue=10000, batch_size=500, fsync_interval=1.0,
+                 max_bytes=10 * 1024 * 1024, rotate_seconds=24 * 3600, backup_count=5):
+        self.path = path
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self.file = None
+        self.opened_at = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="HealthLogWriter", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, record):
+        """Queue one record (a dict); returns False if the queue is full and it was dropped."""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def close(self, timeout=5.0):
+        """Write everything still queued and stop the writer thread."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def open_file(self):
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.opened_at = time.time()
+
+    def should_rotate(self):
+        return (self.file.tell() >= self.max_bytes
+                or time.time() - self.opened_at >= self.rotate_seconds)
+
+    def rotate(self):
+        self.sync()
+        self.file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.open_file()
+
+    def write_batch(self, records):
+        self.file.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records))
+        self.written += len(records)
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def run(self):
+        self.open_file()
+        last_sync = time.monotonic()
+        dirty = False
+        running = True
+        while running:
+            try:
+                batch = [self.queue.get(timeout=self.fsync_interval)]
+            except queue.Empty:
+                batch = []
+            # Take whatever else is already queued, up to one batch
+            while batch and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [record for record in batch if record is not None]
+
+            if batch:
+                if self.should_rotate():
+                    self.rotate()
+                self.write_batch(batch)
+                dirty = True
+            if dirty and (not running or time.monotonic() - last_sync >= self.fsync_interval):
+                self.sync()
+                last_sync = time.monotonic()
+                dirty = False
+
+        # Closing: drain anything queued after the stop marker
+        leftovers = []
+        while True:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not None:
+                leftovers.append(record)
+        if leftovers:
+            self.write_batch(leftovers)
+            self.sync()
+        self.file.close()
@@ -0,0 +1,213 @@
+"""Scale-out hospital ingestion: parse and evaluate bracelet traffic in several worker processes.
+
+One receiver subscribes to smartbracelet/# and hands each message to the
+worker that owns its bracelet (crc32 of the id modulo the worker count),
+through one queue per worker, so every bracelet is evaluated in arrival order
+by exactly one process. A broker shared subscription is not used: it delivers
+a bracelet's messages to several workers, and no forwarding between them can
+restore the order of legacy text readings, which carry no sequence number.
+
+Workers only report alert transitions; the parent merges them into one
+EmergencyStateTable and prints the combined emergency view.
+
+Usage: python hospital_workers.py [--workers 4]
+"""
+import argparse
+import multiprocessing
+import queue
+import random
+import threading
+import time
+import zlib
+
+from mqtt_init import *  # Import broker configurations from mqtt_init.py
+from mqtt_client import KEEPALIVE, create_client
+from alert_rules import AlertEvaluator, RuleReloader, load_rules
+from alert_state import AlertTracker
+from emergency_state import EmergencyStateTable
+from topic_router import TopicRouter
+
+BRACELET_TOPIC = 'smartbracelet/#'
+
+BATCH_SIZE = 500         # Messages per inter-process batch
+BATCH_INTERVAL = 0.02    # Max seconds a message waits for its batch to fill
+STATS_INTERVAL = 1.0     # Seconds between worker stats reports
+
+
+def owner_of(bracelet_id, workers):
+    # crc32 rather than hash(): str hashes differ between processes
+    return zlib.crc32(bracelet_id.encode("utf-8")) % workers
+
+
+def connect_client(name, on_message, topic):
+    client = create_client(name)
+    client.on_message = on_message
+    client.on_connect = lambda client, userdata, flags, rc: client.subscribe(topic)
+    client.connect(resolve_broker(), int(broker_port), KEEPALIVE)
+    client.loop_start()
+    return client
+
+
+class BatchForwarder:
+    """Send (topic, payload) items to worker queues in batches to cut inter-process overhead."""
+
+    def __init__(self, queues):
+        self.queues = queues
+        self.batches = [[] for _ in queues]
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def send(self, index, item):
+        with self.lock:
+            batch = self.batches[index]
+            batch.append(item)
+            if len(batch) < BATCH_SIZE:
+                return
+            self.batches[index] = []
+        self.queues[index].put(batch)
+
+    def flush(self):
+        with self.lock:
+            batches = self.batches
+            self.batches = [[] for _ in self.queues]
+        for index, batch in enumerate(batches):
+            if batch:
+                self.queues[index].put(batch)
+
+    def run(self):
+        while not self.stop_event.wait(BATCH_INTERVAL):
+            self.flush()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.flush()
+
+
+class IngestWorker:
+    """Parses and evaluates the messages of the bracelets one worker process owns."""
+
+    def __init__(self, index, inbox, outbox):
+        self.index = index
+        self.inbox = inbox
+        self.outbox = outbox
+        self.router = TopicRouter()
+        self.alerts = AlertEvaluator(load_rules())
+        self.rule_reloader = RuleReloader(self.alerts.set_rules)
+        self.tracker = AlertTracker(alert_hold_seconds)
+        self.router.register_all(self.evaluate)
+        self.processed = 0
+
+    def evaluate(self, bracelet_id, metric, value):
+        alert, changed = self.tracker.update(bracelet_id, metric, self.alerts.evaluate(bracelet_id, metric, value))
+        if changed:
+            self.outbox.put(("alert", bracelet_id, metric, value, alert))
+
+    def run(self):
+        next_stats = time.monotonic() + STATS_INTERVAL
+        while True:
+            try:
+                batch = self.inbox.get(timeout=STATS_INTERVAL)
+            except queue.Empty:
+                batch = []
+            if batch is None:
+                break
+            for topic, payload in batch:
+                self.router.dispatch(topic, payload)
+            self.processed += len(batch)
+            if time.monotonic() >= next_stats:
+                self.outbox.put(("stats", self.index, self.processed))
+                next_stats = time.monotonic() + STATS_INTERVAL
+
+
+def worker_main(index, inbox, outbox):
+    try:
+        IngestWorker(index, inbox, outbox).run()
+    except KeyboardInterrupt:
+        pass
+
+
+class PartitionReceiver:
+    """The single subscriber that hands messages to their bracelet's worker."""
+
+    def __init__(self, inboxes):
+        self.workers = len(inboxes)
+        self.router = TopicRouter()
+        self.forwarder = BatchForwarder(inboxes)
+        self.client = connect_client(f"HospitalReceiver-{random.randrange(1, 10000000)}",
+                                     self.on_message, BRACELET_TOPIC)
+
+    def on_message(self, client, userdata, msg):
+        bracelet_id = self.router.route(msg.topic)[0]
+        if bracelet_id is not None:
+            self.forwarder.send(owner_of(bracelet_id, self.workers), (msg.topic, msg.payload))
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+        self.forwarder.stop()
+
+
+def print_emergency_view(state, processed, elapsed):
+    critical = state.critical_snapshot()
+    rate = sum(processed.values()) / elapsed if elapsed else 0
+    print(f"Processed {sum(processed.values())} messages ({rate:.0f} msg/s), "
+          f"{len(critical)} bracelets in emergency")
+    for bracelet_id, metrics in sorted(critical.items())[:20]:
+        print(f"  bracelet {bracelet_id}: {', '.join(metrics)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hospital ingestion spread over worker processes.")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="worker processes")
+    parser.add_argument("--report", type=float, default=5.0, help="seconds between emergency view reports")
+    args = parser.parse_args()
+
+    inboxes = [multiprocessing.Queue() for _ in range(args.workers)]
+    outbox = multiprocessing.Queue()
+    processes = []
+    for index in range(args.workers):
+        process = multiprocessing.Process(target=worker_main, args=(index, inboxes[index], outbox),
+                                          name=f"HospitalWorker-{index}", daemon=True)
+        process.start()
+        processes.append(process)
+    receiver = PartitionReceiver(inboxes)
+    print(f"Hospital ingestion running with {args.workers} workers")
+
+    # Merge alert transitions from every worker into one emergency view
+    state = EmergencyStateTable()
+    processed = {}
+    start = time.monotonic()
+    next_report = start + args.report
+    try:
+        while True:
+            try:
+                item = outbox.get(timeout=0.5)
+            except queue.Empty:
+                item = None
+            if item is not None and item[0] == "alert":
+                _, bracelet_id, metric, value, alert = item
+                state.update(bracelet_id, metric, alert is not None)
+                if alert is not None:
+                    print(f"ALERT: {alert} detected on bracelet {bracelet_id}!")
+                else:
+                    print(f"Cleared: {metric} back to normal on bracelet {bracelet_id}")
+            elif item is not None and item[0] == "stats":
+                _, index, count = item
+                processed[index] = count
+            if time.monotonic() >= next_report:
+                print_emergency_view(state, processed, time.monotonic() - start)
+                next_report = time.monotonic() + args.report
+    except KeyboardInterrupt:
+        pass
+    receiver.stop()
+    for inbox in inboxes:
+        inbox.put(None)
+    for process in processes:
+        process.join(5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Opt-in counters, queue depths and latency histograms for the apps.
+
+Off by default: set metrics_enabled in mqtt_init.py or METRICS_ENABLED=1 in
+the environment. When off, @timed returns the function itself and count()
+returns at once, so the hot path pays nothing.
+
+Every thread records into its own dicts (no locks on the hot path); export
+sums them. start_metrics(app) serves them on 127.0.0.1:<port>/metrics in the
+Prometheus text format (and /metrics.json), and/or dumps JSON to
+metrics-<app>.json every metrics_dump_interval seconds.
+"""
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mqtt_init import metrics_dump_interval, metrics_enabled, metrics_ports
+
+ENABLED = metrics_enabled or os.environ.get("METRICS_ENABLED") == "1"
+
+# Latency bucket upper bounds in seconds, from 10 us to 5 s
+BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+_local = threading.local()
+_stores = []         # (counters, histograms) of every thread that recorded something
+_stores_lock = threading.Lock()
+_gauges = {}         # name -> callable returning the current value
+
+
+def _store():
+    try:
+        return _local.store
+    except AttributeError:
+        _local.store = store = ({}, {})
+        with _stores_lock:
+            _stores.append(store)
+        return store
+
+
+def count(name, amount=1):
+    if not ENABLED:
+        return
+    counters = _store()[0]
+    counters[name] = counters.get(name, 0) + amount
+
+
+def observe(name, seconds):
+    """Add one latency sample; histogram is [count per bucket..., overflow, sum]."""
+    histograms = _store()[1]
+    histogram = histograms.get(name)
+    if histogram is None:
+        histogram = histograms[name] = [0] * (len(BUCKETS) + 1) + [0.0]
+    histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+    histogram[-1] += seconds
+
+
+def timed(name):
+    """Decorator recording the duration of every call in the histogram name."""
+    def decorate(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def gauge(name, read):
+    """Report read() as name, e.g. a queue depth, whenever metrics are exported."""
+    if ENABLED:
+        _gauges[name] = read
+
+
+def snapshot():
+    """Return {"counters": ..., "gauges": ..., "histograms": {name: {"buckets", "count", "sum"}}}."""
+    counters = {}
+    histograms = {}
+    with _stores_lock:
+        stores = list(_stores)
+    for thread_counters, thread_histograms in stores:
+        # Other threads keep writing; a slightly stale read is fine for monitoring
+        for name, value in list(thread_counters.items()):
+            counters[name] = counters.get(name, 0) + value
+        for name, histogram in list(thread_histograms.items()):
+            total = histograms.setdefault(name, [0] * len(histogram[:-1]) + [0.0])
+            for index, value in enumerate(list(histogram)):
+                total[index] += value
+    gauges = {}
+    for name, read in list(_gauges.items()):
+        try:
+            gauges[name] = read()
+        except Exception:  # A gauge must never break the export
+            gauges[name] = None
+            count("metrics_gauge_errors")
+    return {
+        "counters": counters,
+        "gauges": gauges,
+        "histograms": {
+            name: {"buckets": dict(zip([str(bound) for bound in BUCKETS] + ["+Inf"], histogram[:-1])),
+                   "count": sum(histogram[:-1]), "sum": histogram[-1]}
+            for name, histogram in histograms.items()
+        },
+    }
+
+
+def prometheus_text(app):
+    data = snapshot()
+    lines = []
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f"# TYPE {name}_total counter")
+        lines.append(f'{name}_total{{app="{app}"}} {value}')
+    for name, value in sorted(data["gauges"].items()):
+        if value is not None:
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f'{name}{{app="{app}"}} {value}')
+    for name, histogram in sorted(data["histograms"].items()):
+        lines.append(f"# TYPE {name}_seconds histogram")
+        cumulative = 0
+        for bound, value in histogram["buckets"].items():
+            cumulative += value
+            lines.append(f'{name}_seconds_bucket{{app="{app}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_seconds_sum{{app="{app}"}} {histogram["sum"]}')
+        lines.append(f'{name}_seconds_count{{app="{app}"}} {histogram["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def serve(app, port):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = prometheus_text(app).encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # No line per scrape
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+    return server
+
+
+def dump_forever(path, interval):
+    while True:
+        time.sleep(interval)
+        with open(path + ".tmp", "w") as file:
+            json.dump(snapshot(), file)
+        os.replace(path + ".tmp", path)  # Readers never see a half-written file
+
+
+def start_metrics(app):
+    """Start the endpoint and/or the JSON dump configured in mqtt_init.py; does nothing when disabled."""
+    if not ENABLED:
+        return
+    log = logging.getLogger("metrics")
+    port = metrics_ports.get(app)
+    if port:
+        try:
+            serve(app, port)
+            log.info("Metrics on http://127.0.0.1:%d/metrics", port)
+        except OSError as error:  # e.g. a second instance of the same app
+            log.warning("Metrics endpoint not started on port %d: %s", port, error)
+    if metrics_dump_interval:
+        threading.Thread(target=dump_forever, args=(f"metrics-{app}.json", metrics_dump_interval),
+                         name="MetricsDump", daemon=True).start()
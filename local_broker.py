@@ -0,0 +1,188 @@
+"""In-process MQTT broker stand-in for benchmarks and offline runs.
+
+LocalClient mimics the part of paho's mqtt.Client used in this project
+(callbacks, connect, subscribe, publish, loop_start/loop_stop), so the same
+publisher and subscriber code can run against LocalBroker without a network.
+Every client gets its own delivery thread, like paho's network thread.
+"""
+import itertools
+import queue
+import threading
+import time
+
+
+def topic_matches(topic_filter, topic):
+    """Return True if topic matches an MQTT topic filter with + and # wildcards."""
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for index, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[index]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+class LocalMessage:
+    """Same attributes as paho's MQTTMessage; timestamp is the perf_counter() time of publish."""
+
+    def __init__(self, topic, payload, qos=0, retain=False, mid=0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = mid
+        self.timestamp = time.perf_counter()
+
+
+class LocalMessageInfo:
+
+    def __init__(self, mid, rc=0):
+        self.mid = mid
+        self.rc = rc
+
+    def is_published(self):
+        return True
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+
+class LocalBroker:
+
+    def __init__(self):
+        self.subscriptions = {}  # topic filter -> set of clients
+        self.route_cache = {}    # topic -> tuple of clients
+        self.retained = {}       # topic -> LocalMessage
+        self.lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, client, topic_filter):
+        with self.lock:
+            self.subscriptions.setdefault(topic_filter, set()).add(client)
+            self.route_cache.clear()
+            retained = [msg for topic, msg in self.retained.items() if topic_matches(topic_filter, topic)]
+        for msg in retained:
+            client.deliver(msg)
+
+    def unsubscribe(self, client, topic_filter):
+        with self.lock:
+            clients = self.subscriptions.get(topic_filter)
+            if clients:
+                clients.discard(client)
+            self.route_cache.clear()
+
+    def remove_client(self, client):
+        with self.lock:
+            for clients in self.subscriptions.values():
+                clients.discard(client)
+            self.route_cache.clear()
+
+    def publish(self, msg):
+        clients = self.route_cache.get(msg.topic)
+        if clients is None:
+            with self.lock:
+                matched = set()
+                for topic_filter, subscribers in self.subscriptions.items():
+                    if topic_matches(topic_filter, msg.topic):
+                        matched.update(subscribers)
+                clients = self.route_cache[msg.topic] = tuple(matched)
+        if msg.retain:
+            with self.lock:
+                if msg.payload:
+                    self.retained[msg.topic] = msg
+                else:
+                    self.retained.pop(msg.topic, None)
+            # Like a real broker: only the copy sent on subscribe carries the retain flag
+            live = LocalMessage(msg.topic, msg.payload, msg.qos, False, msg.mid)
+            live.timestamp = msg.timestamp
+            msg = live
+        self.published += 1
+        for client in clients:
+            client.deliver(msg)
+
+
+class LocalClient:
+
+    _mids = itertools.count(1)
+
+    def __init__(self, client_id="", clean_session=True, userdata=None, broker=None):
+        self.client_id = client_id
+        self.userdata = userdata
+        self.broker = broker
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.on_publish = None
+        self.on_log = None
+        self.inbox = queue.SimpleQueue()
+        self.thread = None
+        self.connected = False
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def connect(self, host=None, port=1883, keepalive=60):
+        self.connected = True
+        self.inbox.put(("connect", 0))
+        return 0
+
+    def disconnect(self):
+        if self.connected:
+            self.connected = False
+            self.broker.remove_client(self)
+            self.inbox.put(("disconnect", 0))
+        return 0
+
+    def subscribe(self, topic, qos=0):
+        self.broker.subscribe(self, topic)
+        return 0, next(self._mids)
+
+    def unsubscribe(self, topic):
+        self.broker.unsubscribe(self, topic)
+        return 0, next(self._mids)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        mid = next(self._mids)
+        self.broker.publish(LocalMessage(topic, payload or b"", qos, retain, mid))
+        if self.on_publish is not None:
+            self.inbox.put(("publish", mid))
+        return LocalMessageInfo(mid)
+
+    def deliver(self, msg):
+        self.inbox.put(msg)
+
+    def backlog(self):
+        return self.inbox.qsize()
+
+    def loop_start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.loop_forever, daemon=True)
+            self.thread.start()
+
+    def loop_stop(self):
+        if self.thread is not None:
+            self.inbox.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def loop_forever(self):
+        while True:
+            item = self.inbox.get()
+            if item is None:
+                return
+            if isinstance(item, LocalMessage):
+                if self.on_message is not None:
+                    self.on_message(self, self.userdata, item)
+            elif item[0] == "connect":
+                if self.on_connect is not None:
+                    self.on_connect(self, self.userdata, {}, item[1])
+            elif item[0] == "publish":
+                self.on_publish(self, self.userdata, item[1])
+            elif item[0] == "disconnect":
+                if self.on_disconnect is not None:
+                    self.on_disconnect(self, self.userdata, item[1])
@@ -0,0 +1,159 @@
+"""The MQTT client shared by the Hospital, Smartphone and SmartBracelet apps.
+
+Connection tuning (keepalive, in-flight window, reconnect backoff) lives here
+so it is set once for every app, the fleet simulator and the hospital workers.
+"""
+import logging
+import threading
+
+import paho.mqtt.client as mqtt
+from app_logging import MessageLog
+from instrumentation import timed
+from mqtt_init import broker_port, message_log_interval, password, resolve_broker, username
+
+KEEPALIVE = 60            # sec between PINGREQs on an idle connection
+MAX_INFLIGHT = 20         # QoS 1/2 messages paho sends before waiting for acks
+MAX_QUEUED = 0            # QoS 1/2 messages paho queues behind the window, 0 - unlimited
+RECONNECT_MIN_DELAY = 1   # sec, paho doubles the delay after each failed reconnect ...
+RECONNECT_MAX_DELAY = 60  # sec, ... up to this
+
+log = logging.getLogger("mqtt")
+
+
+def create_client(name, user=username, secret=password, clean_session=True):
+    """A paho client with the shared tuning applied, not connected yet."""
+    client = mqtt.Client(name, clean_session=clean_session)
+    client.username_pw_set(user, secret)
+    client.max_inflight_messages_set(MAX_INFLIGHT)
+    client.max_queued_messages_set(MAX_QUEUED)
+    client.reconnect_delay_set(RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY)
+    client.enable_logger(logging.getLogger("mqtt.paho"))  # Filtered by level before paho formats anything
+    return client
+
+
+class MqttClientBase:
+    """Connection handling common to the three apps.
+
+    Received messages go through a pipeline of handler(topic, payload)
+    callables added with add_message_handler(), e.g. a TopicRouter's dispatch.
+    Retained messages, which the broker sends when a subscription is made, go
+    to the handlers added with add_retained_handler() instead, if there are any.
+    Topics passed to subscribe_to() are remembered and subscribed again after
+    every reconnect. connect_to() only opens the connection in the background;
+    the network loop runs after start_listening(). on_connected_to_form is
+    called on the network thread, so a form passes a signal's emit, not a slot.
+    """
+
+    def __init__(self, clientname, subscribe_topic=None):
+        self.broker = resolve_broker()  # Waits at most dns_timeout, falls back to the host name
+        self.port = int(broker_port)
+        self.clientname = clientname
+        self.username = username
+        self.password = password
+        self.keepalive = KEEPALIVE
+        self.subscribeTopic = subscribe_topic
+        self.on_connected_to_form = None
+        self.client = None
+        self.connected = False
+        self.listening = False
+        self.topics = []
+        self.lock = threading.Lock()
+        self.message_handlers = []
+        self.retained_handlers = []
+        self.message_log = MessageLog(logging.getLogger("messages"), interval=message_log_interval)
+        if subscribe_topic is not None:
+            self.topics.append(subscribe_topic)
+
+    # Setter methods for each attribute
+    def set_broker(self, value):
+        self.broker = value
+
+    def set_port(self, value):
+        self.port = value
+
+    def set_clientName(self, value):
+        self.clientname = value
+
+    def set_username(self, value):
+        self.username = value
+
+    def set_password(self, value):
+        self.password = value
+
+    def set_on_connected_to_form(self, on_connected_to_form):
+        self.on_connected_to_form = on_connected_to_form
+
+    def add_message_handler(self, handler):
+        self.message_handlers.append(handler)
+
+    def add_retained_handler(self, handler):
+        self.retained_handlers.append(handler)
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            log.info("Connected successfully to broker.")
+            with self.lock:
+                self.connected = True
+                topics = list(self.topics)
+            for topic in topics:
+                client.subscribe(topic)
+            if callable(self.on_connected_to_form):
+                self.on_connected_to_form()  # Trigger the function when connected
+        else:
+            log.error("Failed to connect with code: %s", rc)
+
+    def on_disconnect(self, client, userdata, rc=0):
+        self.connected = False
+        log.warning("Disconnected with code: %s", rc)
+
+    @timed("mqtt_on_message")
+    def on_message(self, client, userdata, msg):
+        topic = msg.topic
+        self.message_log.add(topic, msg.payload)  # Counters and sampled lines, not a print per message
+        handlers = self.retained_handlers if msg.retain and self.retained_handlers else self.message_handlers
+        for handler in handlers:
+            handler(topic, msg.payload)
+
+    def connect_to(self):
+        if self.client is not None:
+            # Connecting again, e.g. with new settings from the form, replaces the old connection
+            self.client.disconnect()
+            self.stop_listening()
+        self.client = create_client(self.clientname, self.username, self.password)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_message = self.on_message
+        log.info("Connecting to broker %s:%s", self.broker, self.port)
+        # Connects, and retries with backoff, on the loop thread once start_listening() runs
+        self.client.connect_async(self.broker, self.port, self.keepalive)
+
+    def disconnect_from(self):
+        self.client.disconnect()
+
+    def start_listening(self):
+        if not self.listening:
+            self.listening = True
+            self.client.loop_start()
+
+    def stop_listening(self):
+        if self.listening:
+            self.listening = False
+            self.client.loop_stop()
+
+    def subscribe_to(self, topic):
+        with self.lock:
+            if topic in self.topics:
+                return
+            self.topics.append(topic)
+            connected = self.connected
+        if connected:
+            self.client.subscribe(topic)
+
+    def unsubscribe_from(self, topic):
+        with self.lock:
+            if topic not in self.topics:
+                return
+            self.topics.remove(topic)
+            connected = self.connected
+        if connected:
+            self.client.unsubscribe(topic)
@@ -1,22 +1,76 @@
+import json
+import logging
+import os
 import socket
+import threading
 
 nb=1 # 0- HIT-"139.162.222.115", 1 - open HiveMQ - broker.hivemq.com
-brokers=[str(socket.gethostbyname('vmm1.saaintertrade.com')), str(socket.gethostbyname('broker.hivemq.com'))]
+broker_hosts=['vmm1.saaintertrade.com', 'broker.hivemq.com']
 
 ports=['80','1883']
 usernames = ['MATZI',''] # should be modified for HIT
 passwords = ['MATZI',''] # should be modified for HIT
-broker_ip=brokers[nb]
-port=ports[nb]
+dns_timeout = 2.0 # sec to wait for the broker address before falling back to its host name
+
+# Optional overrides: a JSON file (mqtt_config.json or $MQTT_CONFIG) with any of
+# "nb", "broker_host", "port", "username", "password", "dns_timeout",
+# then the environment: MQTT_BROKER_NB, MQTT_BROKER_HOST, MQTT_BROKER_PORT,
+# MQTT_USERNAME, MQTT_PASSWORD, MQTT_DNS_TIMEOUT
+def load_config():
+    config = {}
+    path = os.environ.get('MQTT_CONFIG', 'mqtt_config.json')
+    if os.path.exists(path):
+        with open(path) as file:
+            config.update(json.load(file))
+    for key, env in (('nb', 'MQTT_BROKER_NB'), ('broker_host', 'MQTT_BROKER_HOST'), ('port', 'MQTT_BROKER_PORT'),
+                     ('username', 'MQTT_USERNAME'), ('password', 'MQTT_PASSWORD'), ('dns_timeout', 'MQTT_DNS_TIMEOUT')):
+        if env in os.environ:
+            config[key] = os.environ[env]
+    return config
+
+_config = load_config()
+nb = int(_config.get('nb', nb))
+broker_host = _config.get('broker_host', broker_hosts[nb])
+port = str(_config.get('port', ports[nb]))
+username = _config.get('username', usernames[nb])
+password = _config.get('password', passwords[nb])
+dns_timeout = float(_config.get('dns_timeout', dns_timeout))
+
+# Only the selected broker is resolved, once, on a background thread started
+# at import, so importing this module never waits for DNS
+_resolved = {}
+_resolve_done = threading.Event()
+
+def _resolve():
+    try:
+        _resolved['ip'] = socket.gethostbyname(broker_host)
+    except (OSError, UnicodeError) as error:
+        logging.getLogger("mqtt").warning("Could not resolve %s (%s), using the host name", broker_host, error)
+    finally:
+        _resolve_done.set()
+
+threading.Thread(target=_resolve, name='BrokerResolver', daemon=True).start()
+
+def resolve_broker(timeout=None):
+    """Return the broker IP, waiting at most timeout seconds (dns_timeout by default).
+
+    Falls back to the host name if DNS fails or is too slow; the result is cached.
+    """
+    _resolve_done.wait(dns_timeout if timeout is None else timeout)
+    return _resolved.get('ip', broker_host)
+
+def __getattr__(name):
+    # broker_ip is resolved on first use instead of at import time
+    if name == 'broker_ip':
+        return resolve_broker()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-username = usernames[nb]
-password = passwords[nb]
 conn_time = 0 # 0 stands for endless
 mzs=['matzi/','']
 sub_topics =[mzs[nb]+'#','#']
 pub_topics = [mzs[nb]+'test','test']
 
-broker_port=ports[nb]
+broker_port=port
 sub_topic = sub_topics[nb]
 pub_topic = pub_topics[nb]
 
@@ -25,5 +79,37 @@ conn_time = 0 # 0 stands for endless loop
 manag_time = 10 # sec
 
 temp_tsh = 20
+# Logging through app_logging.py: default level and levels per category (mqtt, mqtt.paho, messages, alerts, delivery)
+log_level = 'INFO'
+log_levels = {'mqtt.paho': 'WARNING'}
+message_log_interval = 5 # sec between "Received N messages" summaries, set messages to DEBUG for sampled messages
+
+# Instrumentation (instrumentation.py), off unless enabled here or with METRICS_ENABLED=1
+metrics_enabled = False
+metrics_ports = {'hospital': 9100, 'smartphone': 9101, 'bracelet': 9102} # serves /metrics on 127.0.0.1, 0 - off
+metrics_dump_interval = 0 # sec between dumps to metrics-<app>.json, 0 - off
+gui_fps = 20 # max GUI refreshes per second from MQTT traffic
+
+# Critical thresholds are alert rules in alert_rules.json, reloaded while the apps run
+alert_hold_seconds = 15 # an alert is cleared only after this long without firing again
+vitals_retention_days = 30 # the hospital deletes older readings from vitals.db, 0 - keep everything
+
+# Bracelet payloads: False - four text messages per tick, True - one packed frame per tick
+packed_frames = False
+frame_format = 'struct' # 'struct' - 32 byte binary frame, 'json' - readable frame
+
+# Adaptive reporting on the bracelet (adaptive_sampling.py): a metric is published when it moved by its
+# deadband, after heartbeat_seconds without publishing it, or on every sample near an alert threshold
+deadbands = {'body_temp': 0.1, 'heart_rate': 2, 'oxygen': 0.5, 'sugar': 5} # 0 - publish every sample
+heartbeat_seconds = 30
+approach_margins = {'body_temp': 0.5, 'heart_rate': 10, 'oxygen': 2, 'sugar': 20} # "near" a threshold
+fast_update_rate = 1000 # ms between samples while a value is near a threshold
+
+# Retained snapshots, so a dashboard that just connected shows the ward at once instead of N/A
+retained_snapshots = True # bracelets keep their latest frame retained on the broker
+snapshot_max_age = 2 * heartbeat_seconds # sec, older retained snapshots are from bracelets that went away
+fleet_snapshot_topic = 'ward/fleet_snapshot' # every bracelet in one message, from snapshot_aggregator.py
+fleet_snapshot_interval = 10 # sec between fleet snapshots
+use_fleet_snapshot = False # Hospital also subscribes to fleet_snapshot_topic
 
-customer_id = 10
+customer_id = 10 # sent with every bracelet's registration, the hospital registry maps it to its patients
@@ -0,0 +1,227 @@
+"""Which patient wears which bracelet: bracelet id -> patient, ward, rule profile and customer (SQLite).
+
+Every row is also kept in memory, so lookup() on the message path is one dict
+get and never touches the database. Writes are rare (a nurse assigns a
+bracelet, a device registers) and go to the database and the index together.
+
+A bracelet announces itself on smartbracelet/{id}/register (retained) with
+its device id and customer_id, and leaves a will there with the same device id
+marked offline. The first device to use an id is bound to it; a different
+device, or one of another customer, using the same id is a collision and is
+refused until the binding is released: by the will of the bound device itself
+(a refused duplicate going away releases nothing), or on the command line.
+
+Usage:
+    python patient_registry.py patients.db list
+    python patient_registry.py patients.db assign BRACELET_ID --patient "Dana Levi" [--ward A] [--profile cardiac] [--customer 10]
+    python patient_registry.py patients.db remove BRACELET_ID
+    python patient_registry.py patients.db release BRACELET_ID
+"""
+import argparse
+import json
+import sqlite3
+import threading
+import time
+
+from bracelet_metrics import bracelet_order
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    bracelet_id TEXT PRIMARY KEY,
+    patient TEXT NOT NULL DEFAULT '',
+    ward TEXT NOT NULL DEFAULT '',
+    profile TEXT NOT NULL DEFAULT '',
+    customer_id TEXT NOT NULL DEFAULT '',
+    device_id TEXT NOT NULL DEFAULT '',
+    registered REAL
+) WITHOUT ROWID;
+"""
+COLUMNS = ("bracelet_id", "patient", "ward", "profile", "customer_id", "device_id", "registered")
+
+
+class BraceletIdCollision(ValueError):
+    pass
+
+
+class Patient:
+    """One registry row; replaced, never changed, so readers on other threads see a consistent row."""
+    __slots__ = COLUMNS
+
+    def __init__(self, bracelet_id, patient="", ward="", profile="", customer_id="", device_id="", registered=None):
+        self.bracelet_id = bracelet_id
+        self.patient = patient
+        self.ward = ward
+        self.profile = profile
+        self.customer_id = customer_id
+        self.device_id = device_id
+        self.registered = registered
+
+    def row(self):
+        return tuple(getattr(self, column) for column in COLUMNS)
+
+    def label(self):
+        """Patient name with the ward, for dashboards."""
+        if self.ward:
+            return f"{self.patient or '?'} ({self.ward})"
+        return self.patient
+
+
+class PatientRegistry:
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()  # Serialises writes; lookups go without it
+        db = self.connect()
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+        self.load()
+
+    def load(self):
+        """Read every row into the in-memory index."""
+        db = self.connect()
+        try:
+            rows = db.execute(f"SELECT {', '.join(COLUMNS)} FROM patients").fetchall()
+        finally:
+            db.close()
+        self.index = {row[0]: Patient(*row) for row in rows}
+
+    def watch(self, on_change=None, interval=2.0):
+        """Reload in the background whenever the database changes, e.g. from the command line."""
+        threading.Thread(target=self.run_watch, args=(on_change, interval), name="RegistryWatch", daemon=True).start()
+
+    def run_watch(self, on_change, interval):
+        db = self.connect()
+        # data_version changes when any other connection commits, including this registry's own writes
+        version = db.execute("PRAGMA data_version").fetchone()[0]
+        while True:
+            time.sleep(interval)
+            current = db.execute("PRAGMA data_version").fetchone()[0]
+            if current == version:
+                continue
+            version = current
+            with self.lock:
+                self.load()
+            if on_change is not None:
+                on_change()
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def lookup(self, bracelet_id):
+        """The Patient wearing a bracelet, or None if it is not registered."""
+        return self.index.get(bracelet_id)
+
+    def profiles(self):
+        """{bracelet_id: rule profile} of the bracelets that have one."""
+        return {bracelet_id: patient.profile for bracelet_id, patient in self.index.items() if patient.profile}
+
+    def store(self, patient):
+        db = self.connect()
+        try:
+            with db:
+                db.execute(f"INSERT OR REPLACE INTO patients VALUES ({', '.join('?' * len(COLUMNS))})", patient.row())
+        finally:
+            db.close()
+        self.index[patient.bracelet_id] = patient
+        return patient
+
+    def assign(self, bracelet_id, patient, ward="", profile="", customer_id=""):
+        """Record who wears a bracelet; keeps the device bound to it."""
+        bracelet_id = str(bracelet_id)
+        with self.lock:
+            old = self.index.get(bracelet_id) or Patient(bracelet_id)
+            return self.store(Patient(bracelet_id, patient, ward, profile, str(customer_id),
+                                      old.device_id, old.registered))
+
+    def remove(self, bracelet_id):
+        bracelet_id = str(bracelet_id)
+        with self.lock:
+            db = self.connect()
+            try:
+                with db:
+                    db.execute("DELETE FROM patients WHERE bracelet_id = ?", (bracelet_id,))
+            finally:
+                db.close()
+            self.index.pop(bracelet_id, None)
+
+    def register_device(self, bracelet_id, device_id, customer_id=""):
+        """Bind a device announcing bracelet_id to it; raises BraceletIdCollision if another device has the id."""
+        bracelet_id = str(bracelet_id)
+        customer_id = str(customer_id)
+        with self.lock:
+            old = self.index.get(bracelet_id) or Patient(bracelet_id)
+            if old.device_id and old.device_id != device_id:
+                raise BraceletIdCollision(f"bracelet {bracelet_id} is already used by device {old.device_id}, "
+                                          f"refusing device {device_id}")
+            if old.customer_id and customer_id and old.customer_id != customer_id:
+                raise BraceletIdCollision(f"bracelet {bracelet_id} belongs to customer {old.customer_id}, "
+                                          f"refusing device {device_id} of customer {customer_id}")
+            if old.device_id == device_id and (old.customer_id or not customer_id):
+                return old  # A reconnect, nothing to write
+            return self.store(Patient(bracelet_id, old.patient, old.ward, old.profile, customer_id or old.customer_id,
+                                      device_id, time.time()))
+
+    def release_device(self, bracelet_id, device_id=None):
+        """Unbind the device of a bracelet, only if it is device_id when given; the patient stays assigned.
+
+        Returns True if a device was unbound.
+        """
+        bracelet_id = str(bracelet_id)
+        with self.lock:
+            old = self.index.get(bracelet_id)
+            if old is None or not old.device_id or (device_id is not None and old.device_id != device_id):
+                return False
+            self.store(Patient(bracelet_id, old.patient, old.ward, old.profile, old.customer_id))
+            return True
+
+
+def registration_payload(device_id, customer_id, online=True):
+    """A registration, or with online=False the will announcing that device_id went away."""
+    return json.dumps({"device": device_id, "customer_id": customer_id, "online": online})
+
+
+def parse_registration(payload):
+    """Return (device_id, customer_id, online) from a registration message; raises ValueError if it is malformed."""
+    try:
+        data = json.loads(payload)
+        return str(data["device"]), str(data.get("customer_id", "")), bool(data.get("online", True))
+    except (AttributeError, TypeError, KeyError, UnicodeDecodeError) as error:
+        raise ValueError(f"bad registration {payload!r}: {error!r}") from None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assign bracelets to patients.")
+    parser.add_argument("db", help="registry database file, e.g. patients.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="print every registered bracelet")
+    assign = commands.add_parser("assign", help="record who wears a bracelet")
+    assign.add_argument("bracelet_id")
+    assign.add_argument("--patient", required=True)
+    assign.add_argument("--ward", default="")
+    assign.add_argument("--profile", default="", help="rule group in alert_rules.json")
+    assign.add_argument("--customer", default="")
+    for name, description in (("remove", "forget a bracelet"), ("release", "unbind the device using a bracelet id")):
+        command = commands.add_parser(name, help=description)
+        command.add_argument("bracelet_id")
+    args = parser.parse_args()
+
+    registry = PatientRegistry(args.db)
+    if args.command == "assign":
+        registry.assign(args.bracelet_id, args.patient, args.ward, args.profile, args.customer)
+    elif args.command == "remove":
+        registry.remove(args.bracelet_id)
+    elif args.command == "release":
+        registry.release_device(args.bracelet_id)
+    else:
+        print("bracelet  patient               ward    profile     customer  device")
+        for bracelet_id in sorted(registry.index, key=bracelet_order):
+            patient = registry.index[bracelet_id]
+            print(f"{bracelet_id:<9} {patient.patient:<21} {patient.ward:<7} {patient.profile:<11} "
+                  f"{patient.customer_id:<9} {patient.device_id}")
+
+
+if __name__ == "__main__":
+    main()
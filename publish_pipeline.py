@@ -0,0 +1,139 @@
+import collections
+import threading
+import time
+
+from bracelet_frame import FRAME_METRIC, METRICS
+from mqtt_client import MAX_INFLIGHT
+
+
+class TopicStats:
+    __slots__ = ("published", "acked", "dropped", "ack_total", "ack_max")
+
+    def __init__(self):
+        self.published = 0
+        self.acked = 0
+        self.dropped = 0
+        self.ack_total = 0.0
+        self.ack_max = 0.0
+
+
+class _Queued:
+    """Stands in for MQTTMessageInfo when a QoS 1 message waits for a free in-flight slot."""
+    rc = 0
+    mid = None
+
+
+class PublishPipeline:
+    """QoS-aware publishing with an in-flight window and per-topic delivery metrics.
+
+    qos_for() picks critical_qos for readings that cross a critical threshold
+    and routine_qos for everything else, so only critical readings pay the
+    PUBACK round-trip. At most max_inflight QoS 1 messages (by default the
+    client's own MAX_INFLIGHT window) wait for their PUBACK; further ones
+    queue (up to max_pending, oldest dropped) and go out as acknowledgements
+    arrive. QoS 0 messages never wait for the window.
+    publish() has the same signature as paho's, so StoreAndForward can use a
+    pipeline in place of the client.
+    """
+
+    def __init__(self, rules, max_inflight=MAX_INFLIGHT, max_pending=1000, critical_qos=1, routine_qos=0):
+        self.client = None
+        self.set_rules(rules)
+        self.max_inflight = max_inflight
+        self.max_pending = max_pending
+        self.critical_qos = critical_qos
+        self.routine_qos = routine_qos
+        self.lock = threading.Lock()
+        self.inflight = {}                  # mid -> (topic, send time) of unacknowledged QoS 1+ messages
+        self.pending = collections.deque()  # QoS 1+ messages waiting for a free slot
+        self.early_acks = collections.OrderedDict()  # acks that raced ahead of publish() returning
+        self.stats = collections.defaultdict(TopicStats)
+        self.started = time.monotonic()
+
+    def set_client(self, client):
+        self.client = client
+        client.on_publish = self.on_publish
+
+    def set_rules(self, rules):
+        # Only threshold rules decide the QoS; sustain times do not matter here
+        self.thresholds = {rule.metric: rule for rule in rules if hasattr(rule, "crossed")}
+
+    def qos_for(self, metric, values):
+        """QoS for one reading; values is a single value or, for a packed frame, all metric values."""
+        if metric == FRAME_METRIC:
+            critical = any(self.thresholds[name].crossed(value)
+                           for name, value in zip(METRICS, values) if name in self.thresholds)
+        else:
+            rule = self.thresholds.get(metric)
+            critical = rule is not None and rule.crossed(values)
+        return self.critical_qos if critical else self.routine_qos
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if qos > 0:
+            with self.lock:
+                if len(self.inflight) >= self.max_inflight:
+                    if len(self.pending) >= self.max_pending:
+                        dropped_topic = self.pending.popleft()[0]
+                        self.stats[dropped_topic].dropped += 1
+                    self.pending.append((topic, payload, qos, retain))
+                    return _Queued
+        return self.send(topic, payload, qos, retain)
+
+    def send(self, topic, payload, qos, retain):
+        # Never hold self.lock here: paho calls on_publish while holding its own lock
+        sent_at = time.perf_counter()
+        info = self.client.publish(topic, payload, qos, retain)
+        with self.lock:
+            stats = self.stats[topic]
+            if info.rc != 0:
+                stats.dropped += 1
+                return info
+            stats.published += 1
+            if qos > 0:
+                acked_at = self.early_acks.pop(info.mid, None)
+                if acked_at is None:
+                    self.inflight[info.mid] = (topic, sent_at)
+                else:
+                    self.record_ack(stats, acked_at - sent_at)
+        return info
+
+    def record_ack(self, stats, latency):
+        stats.acked += 1
+        stats.ack_total += latency
+        if latency > stats.ack_max:
+            stats.ack_max = latency
+
+    def on_publish(self, client, userdata, mid):
+        acked_at = time.perf_counter()
+        with self.lock:
+            entry = self.inflight.pop(mid, None)
+            if entry is None:
+                # QoS 0 send, or a PUBACK that arrived before send() stored the mid
+                self.early_acks[mid] = acked_at
+                if len(self.early_acks) > 1024:
+                    self.early_acks.popitem(last=False)
+                return
+            topic, sent_at = entry
+            self.record_ack(self.stats[topic], acked_at - sent_at)
+            message = self.pending.popleft() if self.pending else None
+        if message is not None:
+            self.send(*message)
+
+    def report(self):
+        """Return {topic: delivery metrics} since the pipeline started."""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        with self.lock:
+            return {
+                topic: {
+                    "published": stats.published,
+                    "rate_per_s": round(stats.published / elapsed, 3),
+                    "acked": stats.acked,
+                    "ack_ms_avg": round(stats.ack_total / stats.acked * 1000, 3) if stats.acked else None,
+                    "ack_ms_max": round(stats.ack_max * 1000, 3) if stats.acked else None,
+                    "dropped": stats.dropped,
+                }
+                for topic, stats in self.stats.items()
+            }
+
+    def in_flight(self):
+        return len(self.inflight), len(self.pending)
@@ -0,0 +1,93 @@
+from array import array
+
+
+class RollingWindow:
+    """Fixed-size ring buffer of (timestamp, value) samples with O(1) rolling statistics.
+
+    Running sums are updated incrementally on every add, so mean, stddev and
+    the least-squares slope (units per second) cost O(1). Once per lap of
+    the buffer the sums are rebuilt from the stored samples against a fresh
+    time origin, which keeps float drift from accumulating (O(1) amortised).
+    Memory is two arrays of capacity doubles per window.
+    """
+
+    __slots__ = ("capacity", "times", "values", "next", "count", "origin",
+                 "sum_t", "sum_v", "sum_tt", "sum_vv", "sum_tv")
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.next = 0
+        self.count = 0
+        self.origin = None
+        self.sum_t = self.sum_v = self.sum_tt = self.sum_vv = self.sum_tv = 0.0
+
+    def add(self, ts, value):
+        if self.origin is None:
+            self.origin = ts
+        t = ts - self.origin
+        index = self.next
+        if self.count == self.capacity:
+            old_t = self.times[index]
+            old_v = self.values[index]
+            self.sum_t -= old_t
+            self.sum_v -= old_v
+            self.sum_tt -= old_t * old_t
+            self.sum_vv -= old_v * old_v
+            self.sum_tv -= old_t * old_v
+        else:
+            self.count += 1
+        self.times[index] = t
+        self.values[index] = value
+        self.sum_t += t
+        self.sum_v += value
+        self.sum_tt += t * t
+        self.sum_vv += value * value
+        self.sum_tv += t * value
+        self.next = (index + 1) % self.capacity
+        if self.next == 0:
+            self.rebuild()
+
+    def rebuild(self):
+        """Recompute the sums exactly, with the oldest sample as the new time origin."""
+        oldest = self.next if self.count == self.capacity else 0
+        shift = self.times[oldest]
+        self.origin += shift
+        self.sum_t = self.sum_v = self.sum_tt = self.sum_vv = self.sum_tv = 0.0
+        for index in range(self.count):
+            t = self.times[index] - shift
+            value = self.values[index]
+            self.times[index] = t
+            self.sum_t += t
+            self.sum_v += value
+            self.sum_tt += t * t
+            self.sum_vv += value * value
+            self.sum_tv += t * value
+
+    def latest(self):
+        return self.values[self.next - 1] if self.count else None
+
+    def span(self):
+        """Seconds between the oldest and the newest sample."""
+        if self.count < 2:
+            return 0.0
+        oldest = self.next if self.count == self.capacity else 0
+        return self.times[self.next - 1] - self.times[oldest]
+
+    def mean(self):
+        return self.sum_v / self.count if self.count else None
+
+    def stddev(self):
+        if self.count < 2:
+            return 0.0
+        mean = self.sum_v / self.count
+        return max(0.0, self.sum_vv / self.count - mean * mean) ** 0.5
+
+    def slope(self):
+        """Least-squares rate of change in value units per second."""
+        n = self.count
+        denominator = n * self.sum_tt - self.sum_t * self.sum_t
+        if n < 2 or denominator <= 1e-9:
+            return 0.0
+        return (n * self.sum_tv - self.sum_t * self.sum_v) / denominator
@@ -1,22 +1,194 @@
+"""Start the apps and keep them running.
+
+Every child is watched at once: one that fails (non-zero exit code or killed
+by a signal) is restarted after a delay that doubles from RESTART_MIN_DELAY
+to RESTART_MAX_DELAY (reset once it has stayed up for STABLE_SECONDS). One
+that exits with code 0, e.g. a window the user closed, is left stopped; the
+supervisor ends when every child has. Each child's output goes to logs/<role>-<n>.log
+and every --report seconds the supervisor prints CPU, RSS and messages/sec per
+child (CPU and RSS from /proc, so Linux only; elsewhere they show n/a).
+
+Usage: python runAll.py [--hospital 1] [--smartphone 1] [--bracelet 1] [--fleet 0] [--workers 0] [--aggregator 0]
+"""
+import argparse
+import os
+import re
+import socket
 import subprocess
+import sys
+import threading
+import time
+
+# Role -> script; --<role> N starts N instances
+ROLES = {
+    "hospital": "Hospital.py",
+    "smartphone": "Smartphone.py",
+    "bracelet": "SmartBracelet.py",
+    "fleet": "fleet_simulator.py",
+    "workers": "hospital_workers.py",
+    "aggregator": "snapshot_aggregator.py",
+}
+DEFAULT_INSTANCES = {"hospital": 1, "smartphone": 1, "bracelet": 1, "fleet": 0, "workers": 0, "aggregator": 0}
+
+RESTART_MIN_DELAY = 1     # sec
+RESTART_MAX_DELAY = 60    # sec
+STABLE_SECONDS = 60       # a child up this long is healthy again and restarts from the minimum delay
+POLL_INTERVAL = 0.5       # sec between liveness checks
+STOP_TIMEOUT = 5          # sec to wait after terminate() before kill()
+
+# Message counts come from the running totals in the children's own output: the apps'
+# "Received N messages" summaries, the simulator, the workers and the bracelet's delivery report
+MESSAGE_TOTAL = re.compile(r"\b(?:Received|Published|Processed) (?P<total>\d+) messages")
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def process_usage(pid):
+    """Return (cpu seconds, rss bytes) of a process, or None if /proc is not available."""
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as file:
+            rss_pages = int(file.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    # utime and stime are fields 14 and 15 of stat, 12 and 13 after the command name
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, rss_pages * PAGE_SIZE
+
+
+class Child:
+    """One supervised instance of a role, with its log file and counters."""
+
+    def __init__(self, role, index, script, log_dir):
+        self.name = f"{role}-{index}"
+        self.command = [sys.executable, "-u", script]
+        self.log_path = os.path.join(log_dir, self.name + ".log")
+        self.env = None
+        if role == "bracelet":
+            # Each local bracelet is its own device in the hospital's registry, the same one after a restart
+            self.env = dict(os.environ, BRACELET_DEVICE_ID=f"{socket.gethostname()}-{self.name}")
+        self.process = None
+        self.restarts = 0
+        self.delay = RESTART_MIN_DELAY
+        self.started = 0.0
+        self.restart_at = None
+        self.finished = False  # Exited cleanly, not restarted
+        self.total = 0  # Latest running message total the child printed
+        self.reported = (time.monotonic(), 0, None)  # time, messages and cpu seconds at the last report
+
+    def start(self):
+        here = os.path.dirname(os.path.abspath(__file__))
+        log = open(self.log_path, "a", buffering=1)
+        log.write(f"--- {time.strftime('%Y-%m-%d %H:%M:%S')} starting {' '.join(self.command)}\n")
+        self.process = subprocess.Popen(self.command, cwd=here, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        stdin=subprocess.DEVNULL, text=True, errors="replace", env=self.env)
+        self.started = time.monotonic()
+        self.restart_at = None
+        self.total = 0
+        self.reported = (self.started, 0, None)
+        threading.Thread(target=self.capture, args=(self.process, log), name=f"{self.name}-log", daemon=True).start()
+        print(f"Started {self.name} (pid {self.process.pid}), log in {self.log_path}")
+
+    def capture(self, process, log):
+        with log:
+            for line in process.stdout:
+                log.write(line)
+                match = MESSAGE_TOTAL.search(line)
+                if match:
+                    self.total = int(match.group("total"))
+
+    def messages(self):
+        return self.total
+
+    def check(self, now):
+        """Restart the child if it failed and its backoff delay is over."""
+        if self.finished:
+            return
+        if self.process is None:
+            self.start()
+            return
+        if self.restart_at is not None:
+            if now >= self.restart_at:
+                self.restarts += 1
+                self.start()
+            return
+        code = self.process.poll()
+        if code is None:
+            if now - self.started >= STABLE_SECONDS:
+                self.delay = RESTART_MIN_DELAY
+            return
+        if code == 0:
+            print(f"{self.name} exited cleanly, not restarting")
+            self.finished = True
+            return
+        # A negative code is the signal that killed the child
+        print(f"{self.name} exited with code {code}, restarting in {self.delay}s")
+        self.restart_at = now + self.delay
+        self.delay = min(self.delay * 2, RESTART_MAX_DELAY)
+
+    def report(self, now):
+        last_time, last_messages, last_cpu = self.reported
+        messages = self.messages()
+        rate = (messages - last_messages) / max(now - last_time, 1e-9)
+        alive = self.restart_at is None and self.process.poll() is None
+        usage = process_usage(self.process.pid) if alive else None
+        cpu = rss = "n/a"
+        if usage is not None:
+            if last_cpu is not None:
+                cpu = f"{(usage[0] - last_cpu) / max(now - last_time, 1e-9) * 100:.1f}%"
+            rss = f"{usage[1] / 2 ** 20:.1f}MB"
+        self.reported = (now, messages, usage[0] if usage is not None else None)
+        state = f"pid {self.process.pid}" if alive else "exited" if self.finished else "restarting"
+        return f"{self.name:<14} {state:<12} restarts {self.restarts:<3} cpu {cpu:<7} rss {rss:<9} {rate:.0f} msg/s"
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+    def wait(self):
+        if self.process is None:
+            return
+        try:
+            self.process.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run and supervise the hospital, smartphone and bracelet apps.")
+    for role, script in ROLES.items():
+        parser.add_argument(f"--{role}", type=int, default=DEFAULT_INSTANCES[role], metavar="N",
+                            help=f"instances of {script} (default {DEFAULT_INSTANCES[role]})")
+    parser.add_argument("--log-dir", default="logs", help="directory for the per-process logs")
+    parser.add_argument("--report", type=float, default=10.0, help="seconds between resource reports")
+    args = parser.parse_args()
+
+    os.makedirs(args.log_dir, exist_ok=True)
+    children = [Child(role, index, script, args.log_dir)
+                for role, script in ROLES.items() for index in range(getattr(args, role))]
+    next_report = time.monotonic() + args.report
+    try:
+        while True:
+            now = time.monotonic()
+            for child in children:
+                child.check(now)
+            if all(child.finished for child in children):
+                break
+            if now >= next_report:
+                for child in children:
+                    print(child.report(now))
+                next_report = now + args.report
+            time.sleep(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        print("Terminating all processes...")
+    for child in children:
+        child.stop()
+    for child in children:
+        child.wait()
+    print("All processes terminated.")
+
 
-# List of scripts to run
-scripts = ["Hospital.py", "Smartphone.py", "SmartBracelet.py"]
-
-# Launch each script in a separate process
-processes = []
-for script in scripts:
-    print(f"Starting {script}...")
-    process = subprocess.Popen(["python", script])
-    processes.append(process)
-
-# Wait for all processes to complete
-try:
-    for process in processes:
-        process.wait()
-except KeyboardInterrupt:
-    print("Terminating all processes...")
-    for process in processes:
-        process.terminate()
-
-print("All processes terminated.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Publish the latest values of every bracelet as one retained fleet snapshot.
+
+A dashboard subscribed to smartbracelet/# already gets one retained snapshot
+per bracelet on connect; with thousands of bracelets that is thousands of
+messages. This aggregator follows the live traffic and every
+fleet_snapshot_interval seconds publishes the whole ward, zlib-compressed, to
+fleet_snapshot_topic (retained), so a Hospital with use_fleet_snapshot on
+fills the ward from a single message. A bracelet not heard from for
+snapshot_max_age seconds is left out of the next fleet snapshot.
+
+Usage: python snapshot_aggregator.py [--interval 10] [--topic ward/fleet_snapshot]
+"""
+import argparse
+import random
+import threading
+import time
+
+from bracelet_frame import METRICS, encode_fleet_snapshot
+from topic_router import TopicRouter
+
+BRACELET_TOPIC = 'smartbracelet/#'
+
+
+class SnapshotAggregator:
+    """Latest values per bracelet, fed with handle(topic, payload) from any thread."""
+
+    def __init__(self, max_age=None):
+        self.lock = threading.Lock()
+        self.latest = {}  # bracelet_id -> [timestamp, values in METRICS order]
+        self.max_age = max_age
+        self.router = TopicRouter(snapshot_max_age=max_age)
+        self.router.register_all(self.update)
+
+    def update(self, bracelet_id, metric, value):
+        with self.lock:
+            entry = self.latest.get(bracelet_id)
+            if entry is None:
+                entry = self.latest[bracelet_id] = [0.0, [None] * len(METRICS)]
+            entry[0] = time.time()
+            entry[1][METRICS.index(metric)] = value
+
+    def handle(self, topic, payload):
+        self.router.dispatch_retained(topic, payload)
+
+    def entries(self):
+        """Return [(bracelet_id, timestamp, values)] of the bracelets with every metric known."""
+        with self.lock:
+            if self.max_age is not None:
+                # Bracelets that went away; a live one publishes at least every heartbeat
+                cutoff = time.time() - self.max_age
+                for bracelet_id in [bracelet_id for bracelet_id, entry in self.latest.items() if entry[0] < cutoff]:
+                    del self.latest[bracelet_id]
+            return [(bracelet_id, timestamp, tuple(values)) for bracelet_id, (timestamp, values) in self.latest.items()
+                    if None not in values]
+
+
+def main():
+    from mqtt_client import KEEPALIVE, create_client
+    from mqtt_init import broker_port, fleet_snapshot_interval, fleet_snapshot_topic, resolve_broker, snapshot_max_age
+
+    parser = argparse.ArgumentParser(description="Publish a retained snapshot of every bracelet.")
+    parser.add_argument("--interval", type=float, default=fleet_snapshot_interval, help="seconds between snapshots")
+    parser.add_argument("--topic", default=fleet_snapshot_topic)
+    args = parser.parse_args()
+
+    aggregator = SnapshotAggregator(snapshot_max_age)
+    client = create_client(f"SnapshotAggregator-{random.randrange(1, 10000000)}")
+    client.on_message = lambda client, userdata, msg: aggregator.handle(msg.topic, msg.payload)
+    client.on_connect = lambda client, userdata, flags, rc: client.subscribe(BRACELET_TOPIC)
+    client.connect(resolve_broker(), int(broker_port), KEEPALIVE)
+    client.loop_start()
+    print(f"Publishing a snapshot of {BRACELET_TOPIC} to {args.topic} every {args.interval}s, Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(args.interval)
+            entries = aggregator.entries()
+            payload = encode_fleet_snapshot(entries)
+            client.publish(args.topic, payload, qos=1, retain=True)
+            print(f"Published a snapshot of {len(entries)} bracelets ({len(payload)} bytes)")
+    except KeyboardInterrupt:
+        pass
+    client.loop_stop()
+    client.disconnect()
+
+
+if __name__ == "__main__":
+    main()
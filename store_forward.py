@@ -0,0 +1,90 @@
+import collections
+import threading
+import time
+
+
+class StoreAndForward:
+    """Publish through a paho client, keeping messages in a bounded queue while offline.
+
+    While disconnected publish() only appends to an in-memory deque; when it
+    is full the oldest message is dropped. After a reconnect a replay thread
+    sends the backlog in batches of replay_batch at no more than replay_rate
+    messages per second, so the broker is not flooded. New messages go out
+    directly while the backlog drains, so the queue only ever holds what was
+    published offline. publish_many() lets a caller queue something else than
+    what it publishes live, such as one frame with the sample time in place of
+    text readings that would arrive undated.
+    """
+
+    def __init__(self, max_queued=10000, replay_batch=50, replay_rate=200):
+        self.client = None
+        self.connected = False
+        self.queue = collections.deque(maxlen=max_queued)
+        self.replay_batch = replay_batch
+        self.replay_rate = replay_rate
+        self.lock = threading.Lock()
+        self.replaying = False
+        self.dropped = 0
+        self.replayed = 0
+
+    def set_client(self, client):
+        self.client = client
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Publish now if connected; returns False if the message was queued instead."""
+        return self.publish_many([(topic, payload, qos, retain)])
+
+    def publish_many(self, messages, offline=None):
+        """Publish messages [(topic, payload, qos, retain)] in order now if connected, else queue them.
+
+        Only the messages that did not go out are queued, or what offline(unsent)
+        returns in their place. Returns False if anything was queued.
+        """
+        with self.lock:
+            unsent = messages
+            if self.connected:
+                for index, message in enumerate(messages):
+                    if self.client.publish(*message).rc != 0:
+                        self.connected = False  # paho noticed the drop before on_disconnect ran
+                        unsent = messages[index:]
+                        break
+                else:
+                    return True
+            for message in unsent if offline is None else offline(unsent):
+                if len(self.queue) == self.queue.maxlen:
+                    self.dropped += 1
+                self.queue.append(message)
+            return False
+
+    def queued(self):
+        return len(self.queue)
+
+    def on_connected(self):
+        with self.lock:
+            self.connected = True
+            if not self.queue or self.replaying:
+                return
+            self.replaying = True
+        threading.Thread(target=self.replay, name="StoreAndForwardReplay", daemon=True).start()
+
+    def on_disconnected(self):
+        with self.lock:
+            self.connected = False
+
+    def replay(self):
+        pause = self.replay_batch / self.replay_rate
+        while True:
+            with self.lock:
+                if not self.connected or not self.queue:
+                    self.replaying = False
+                    return
+                batch = [self.queue.popleft() for _ in range(min(self.replay_batch, len(self.queue)))]
+                for index, message in enumerate(batch):
+                    if self.client.publish(*message).rc != 0:
+                        # Connection lost mid-replay: put the rest back in front, in order
+                        self.queue.extendleft(reversed(batch[index:]))
+                        self.connected = False
+                        self.replaying = False
+                        return
+                    self.replayed += 1
+            time.sleep(pause)
@@ -0,0 +1,118 @@
+import json
+import os
+import time
+
+import pytest
+
+from alert_rules import AlertEvaluator, RuleReloader, RuleSet, ThresholdRule, compile_rules
+
+RULES = {
+    "sustain_seconds": 10,
+    "rules": [
+        {"metric": "heart_rate", "above": 120, "hysteresis": 5, "alert": "Critical heart rate"},
+        {"metric": "oxygen", "below": 90, "alert": "Low oxygen level", "sustain_seconds": 0},
+        {"metric": "sugar", "rate_above": 2.0, "min_samples": 3, "alert": "Sugar rising fast"},
+    ],
+    "groups": {
+        "cardiac": {"bracelets": ["12", 40],
+                    "rules": [{"metric": "heart_rate", "above": 110, "alert": "Cardiac heart rate"}]},
+    },
+}
+
+
+@pytest.mark.parametrize("config", [
+    [],
+    {"rules": [1]},
+    {"rules": {"a": 1}},
+    {"rules": [{"metric": "pulse", "above": 1, "alert": "x"}]},
+    {"rules": [{"metric": "oxygen", "alert": "x"}]},
+    {"rules": [{"metric": "oxygen", "below": None, "alert": "x"}]},
+    {"rules": [{"metric": "oxygen", "rate_above": 1, "min_samples": 1e400, "alert": "x"}]},
+    {"sustain_seconds": []},
+    {"groups": []},
+    {"groups": {"g": 1}},
+    {"groups": {"g": {"bracelets": "12", "rules": []}}},
+    {"groups": {"g": {"bracelets": [{}], "rules": []}}},
+    {"groups": {"a": {"bracelets": ["1"]}, "b": {"bracelets": [1]}}},
+])
+def test_bad_rules_raise_value_error(config):
+    with pytest.raises(ValueError):
+        compile_rules(config)
+
+
+def test_group_rules_replace_ward_rules_per_metric():
+    ruleset = compile_rules(RULES)
+    assert ruleset.rules_for("1", "heart_rate")[0].threshold == 120
+    assert ruleset.rules_for("12", "heart_rate")[0].threshold == 110
+    assert ruleset.rules_for("40", "heart_rate")[0].threshold == 110
+    assert ruleset.rules_for("12", "oxygen") == ruleset.rules_for("1", "oxygen")
+
+
+def test_profiles_override_file_groups():
+    ruleset = compile_rules(RULES)
+    assert ruleset.set_profiles({"7": "cardiac", "8": "missing"}) == ["missing"]
+    assert ruleset.rules_for("7", "heart_rate")[0].threshold == 110
+    assert ruleset.rules_for("8", "heart_rate")[0].threshold == 120
+    assert ruleset.set_profiles({}) == []
+    assert ruleset.rules_for("7", "heart_rate")[0].threshold == 120
+    assert ruleset.rules_for("12", "heart_rate")[0].threshold == 110
+
+
+def test_threshold_fires_only_after_sustain_seconds():
+    evaluator = AlertEvaluator(compile_rules(RULES))
+    assert evaluator.evaluate("1", "heart_rate", 130, ts=0) is None
+    assert evaluator.evaluate("1", "heart_rate", 131, ts=5) is None
+    assert evaluator.evaluate("1", "heart_rate", 132, ts=10) == "Critical heart rate"
+
+
+def test_threshold_below_without_sustain_fires_at_once():
+    evaluator = AlertEvaluator(compile_rules(RULES))
+    assert evaluator.evaluate("1", "oxygen", 95, ts=0) is None
+    assert evaluator.evaluate("1", "oxygen", 85, ts=1) == "Low oxygen level"
+
+
+def test_hysteresis_keeps_the_alert_until_the_value_is_clear():
+    rule = ThresholdRule("heart_rate", 120, "Critical heart rate", hysteresis=5)
+    evaluator = AlertEvaluator(RuleSet([rule]))
+    assert evaluator.evaluate("1", "heart_rate", 125, ts=0) == "Critical heart rate"
+    assert evaluator.evaluate("1", "heart_rate", 118, ts=1) == "Critical heart rate"  # Within the hysteresis
+    assert evaluator.evaluate("1", "heart_rate", 114, ts=2) is None
+    assert evaluator.evaluate("1", "heart_rate", 118, ts=3) is None  # Below the threshold, not crossed again
+
+
+def test_rate_rule_needs_min_samples_and_a_steep_slope():
+    evaluator = AlertEvaluator(compile_rules(RULES))
+    assert evaluator.evaluate("1", "sugar", 100, ts=0) is None
+    assert evaluator.evaluate("1", "sugar", 110, ts=1) is None  # Only two samples
+    assert evaluator.evaluate("1", "sugar", 120, ts=2) == "Sugar rising fast"
+    evaluator.forget("1")
+    for ts in range(5):
+        assert evaluator.evaluate("1", "sugar", 100 + ts, ts=ts) is None  # 1 per second
+
+
+def write_rules(path, content):
+    with open(path, "w") as file:
+        file.write(content)
+    # Another mtime even on file systems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+
+def test_reloader_survives_a_file_of_the_wrong_shape(tmp_path):
+    path = str(tmp_path / "rules.json")
+    write_rules(path, json.dumps(RULES))
+    loaded = []
+    reloader = RuleReloader(loaded.append, path=path, interval=0.02)
+    try:
+        write_rules(path, '{"rules": [1]}')
+        time.sleep(0.2)
+        assert loaded == []
+        assert reloader.thread.is_alive()
+        write_rules(path, json.dumps({"rules": RULES["rules"][:1]}))
+        deadline = time.monotonic() + 2
+        while not loaded and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert len(loaded) == 1
+        assert loaded[0].rules_for("1", "oxygen") == ()
+    finally:
+        reloader.stop()
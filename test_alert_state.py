@@ -0,0 +1,38 @@
+from alert_state import AlertTracker
+
+
+def test_raise_and_repeats():
+    tracker = AlertTracker(hold_seconds=10)
+    assert tracker.update("1", "oxygen", None, ts=0) == (None, False)
+    assert tracker.update("1", "oxygen", "Low oxygen level", ts=1) == ("Low oxygen level", True)
+    assert tracker.update("1", "oxygen", "Low oxygen level", ts=2) == ("Low oxygen level", False)
+    assert tracker.update("1", "oxygen", "Very low oxygen level", ts=3) == ("Very low oxygen level", True)
+
+
+def test_clear_waits_for_the_hold_time():
+    tracker = AlertTracker(hold_seconds=10)
+    tracker.update("1", "oxygen", "Low oxygen level", ts=0)
+    assert tracker.update("1", "oxygen", None, ts=5) == ("Low oxygen level", False)
+    tracker.update("1", "oxygen", "Low oxygen level", ts=6)  # Fired again, the hold restarts
+    assert tracker.update("1", "oxygen", None, ts=12) == ("Low oxygen level", False)
+    assert tracker.update("1", "oxygen", None, ts=16) == (None, True)
+    assert tracker.update("1", "oxygen", None, ts=17) == (None, False)
+    assert tracker.active == {}
+
+
+def test_metrics_and_bracelets_are_tracked_apart():
+    tracker = AlertTracker(hold_seconds=0)
+    tracker.update("1", "oxygen", "Low oxygen level", ts=0)
+    assert tracker.update("1", "sugar", None, ts=1) == (None, False)
+    assert tracker.update("2", "oxygen", None, ts=1) == (None, False)
+    assert tracker.update("1", "oxygen", None, ts=1) == (None, True)
+
+
+def test_forget_drops_every_metric_of_a_bracelet():
+    tracker = AlertTracker()
+    tracker.update("1", "oxygen", "Low oxygen level", ts=0)
+    tracker.update("1", "heart_rate", "Critical heart rate", ts=0)
+    tracker.update("2", "oxygen", "Low oxygen level", ts=0)
+    tracker.forget("1")
+    assert list(tracker.active) == [("2", "oxygen")]
+    assert tracker.update("1", "oxygen", "Low oxygen level", ts=1) == ("Low oxygen level", True)
@@ -0,0 +1,48 @@
+import pytest
+
+from bracelet_frame import FRAME_SIZE, decode_fleet_snapshot, decode_frame, encode_fleet_snapshot, encode_frame
+from topic_router import TopicRouter
+
+VALUES = (36.6, 80.5, 97.0, 120.25)
+
+
+def test_struct_frame_round_trip():
+    payload = encode_frame(VALUES, 7, 1700000000.5)
+    assert len(payload) == FRAME_SIZE
+    assert decode_frame(payload) == (7, 1700000000.5, VALUES)
+
+
+def test_json_frame_round_trip():
+    payload = encode_frame(VALUES, 7, 1700000000.5, "json")
+    assert decode_frame(payload) == (7, 1700000000.5, VALUES)
+
+
+@pytest.mark.parametrize("payload", [
+    b'{"seq": null, "ts": 1, "body_temp": 1, "heart_rate": 1, "oxygen": 1, "sugar": 1}',
+    b'{"seq": 1e400, "ts": 1, "body_temp": 1, "heart_rate": 1, "oxygen": 1, "sugar": 1}',
+    b'{"seq": 1, "ts": [], "body_temp": 1, "heart_rate": 1, "oxygen": 1, "sugar": 1}',
+    b'{"seq": 1, "ts": 1, "body_temp": "hot", "heart_rate": 1, "oxygen": 1, "sugar": 1}',
+    b'{"seq": 1, "ts": 1',
+    b"\x42\x01",
+])
+def test_bad_frames_raise_value_error(payload):
+    with pytest.raises(ValueError):
+        decode_frame(payload)
+
+
+@pytest.mark.parametrize("metric", ["frame", "snapshot", "replay"])
+def test_router_counts_bad_frames(metric):
+    router = TopicRouter()
+    router.register_all(lambda *args: None)
+    router.register_replay(lambda *args: None)
+    payload = b'{"seq": 1e400, "ts": 1, "body_temp": 1, "heart_rate": 1, "oxygen": 1, "sugar": 1}'
+    assert not router.dispatch_retained(f"smartbracelet/1/{metric}", payload)
+    assert not router.dispatch(f"smartbracelet/1/{metric}", payload)
+    assert router.bad_payloads == (2 if metric != "snapshot" else 1)
+
+
+def test_fleet_snapshot_round_trip():
+    entries = [("1", 1700000000.0, VALUES), ("12", 1700000001.0, VALUES)]
+    assert decode_fleet_snapshot(encode_fleet_snapshot(entries)) == entries
+    with pytest.raises(ValueError):
+        decode_fleet_snapshot(b"not zlib")
@@ -0,0 +1,44 @@
+import pytest
+
+from patient_registry import BraceletIdCollision, PatientRegistry, parse_registration, registration_payload
+
+
+def test_register_device_refuses_another_device(tmp_path):
+    registry = PatientRegistry(str(tmp_path / "patients.db"))
+    registry.register_device(12, "host-a-12", "7")
+    assert registry.register_device("12", "host-a-12", "7").device_id == "host-a-12"  # A reconnect
+    with pytest.raises(BraceletIdCollision):
+        registry.register_device("12", "host-b-12", "7")
+    with pytest.raises(BraceletIdCollision):
+        registry.register_device("12", "host-a-12", "8")
+
+
+def test_release_device_needs_the_bound_device(tmp_path):
+    registry = PatientRegistry(str(tmp_path / "patients.db"))
+    registry.assign("12", "Ada", ward="A")
+    registry.register_device("12", "host-a-12")
+    assert not registry.release_device("12", "host-b-12")  # A late will of an older device
+    assert registry.lookup("12").device_id == "host-a-12"
+    assert registry.release_device("12", "host-a-12")
+    assert registry.lookup("12").device_id == ""
+    assert registry.lookup("12").patient == "Ada"
+    registry.register_device("12", "host-b-12")
+
+
+def test_registry_reloads_from_disk(tmp_path):
+    path = str(tmp_path / "patients.db")
+    PatientRegistry(path).assign("3", "Grace", profile="cardiac")
+    registry = PatientRegistry(path)
+    assert registry.lookup("3").label() == "Grace"
+    assert registry.profiles() == {"3": "cardiac"}
+
+
+def test_registration_round_trip():
+    assert parse_registration(registration_payload("host-a-12", "7", online=False)) == ("host-a-12", "7", False)
+    assert parse_registration(b'{"device": "d"}') == ("d", "", True)
+
+
+@pytest.mark.parametrize("payload", [b"", b"[]", b'{"customer_id": "7"}', b"\xff", b"1"])
+def test_bad_registrations_raise_value_error(payload):
+    with pytest.raises(ValueError):
+        parse_registration(payload)
@@ -0,0 +1,39 @@
+import statistics
+
+import pytest
+
+from rolling_stats import RollingWindow
+
+
+def test_empty_window():
+    window = RollingWindow(4)
+    assert window.count == 0
+    assert window.latest() is None
+    assert window.mean() is None
+    assert window.stddev() == 0.0
+    assert window.slope() == 0.0
+    assert window.span() == 0.0
+
+
+def test_statistics_match_a_full_recomputation():
+    window = RollingWindow(8)
+    samples = [(1000.0 + ts * 0.5, 80 + (ts * 7) % 11) for ts in range(30)]
+    for ts, value in samples:
+        window.add(ts, value)
+    kept = samples[-8:]
+    values = [value for _, value in kept]
+    assert window.count == 8
+    assert window.latest() == values[-1]
+    assert window.mean() == pytest.approx(statistics.fmean(values))
+    assert window.stddev() == pytest.approx(statistics.pstdev(values))
+    assert window.span() == pytest.approx(kept[-1][0] - kept[0][0])
+    assert window.slope() == pytest.approx(statistics.linear_regression(
+        [ts for ts, _ in kept], values).slope)
+
+
+def test_slope_of_a_steady_rise_survives_many_laps():
+    window = RollingWindow(16)
+    for step in range(10000):
+        window.add(1.7e9 + step, 100 + 2.0 * step)
+    assert window.slope() == pytest.approx(2.0)
+    assert window.span() == pytest.approx(15.0)
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from store_forward import StoreAndForward
+
+
+class Info:
+    def __init__(self, rc):
+        self.rc = rc
+
+
+class FakeClient:
+    """Records what is published; fails every publish after fail_after successful ones."""
+
+    def __init__(self, fail_after=None):
+        self.sent = []
+        self.fail_after = fail_after
+        self.lock = threading.Lock()
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        with self.lock:
+            if self.fail_after is not None and len(self.sent) >= self.fail_after:
+                return Info(4)
+            self.sent.append(topic)
+            return Info(0)
+
+
+def message(topic):
+    return (topic, b"", 0, False)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_queues_while_offline_and_replays_in_order():
+    outbox = StoreAndForward(replay_rate=100000)
+    client = FakeClient()
+    outbox.set_client(client)
+    assert not outbox.publish("a", b"")
+    assert not outbox.publish("b", b"")
+    assert outbox.queued() == 2
+    outbox.on_connected()
+    assert wait_for(lambda: outbox.queued() == 0)
+    assert client.sent == ["a", "b"]
+
+
+def test_live_messages_skip_the_backlog():
+    outbox = StoreAndForward(replay_batch=1, replay_rate=2)  # Half a second per replayed message
+    client = FakeClient()
+    outbox.set_client(client)
+    for index in range(3):
+        outbox.publish(f"old-{index}", b"")
+    outbox.on_connected()
+    assert outbox.publish_many([message("live")], lambda unsent: [message("replay")])
+    assert "live" in client.sent
+    assert client.sent.index("live") < 3  # Not behind the whole backlog
+    assert "replay" not in client.sent
+    outbox.on_disconnected()
+
+
+def test_partial_failure_queues_only_the_unsent_messages():
+    outbox = StoreAndForward()
+    client = FakeClient(fail_after=1)
+    outbox.set_client(client)
+    outbox.on_connected()
+    seen = []
+
+    def offline(unsent):
+        seen.extend(topic for topic, *_ in unsent)
+        return unsent
+
+    assert not outbox.publish_many([message("a"), message("b"), message("c")], offline)
+    assert client.sent == ["a"]
+    assert seen == ["b", "c"]
+    assert [topic for topic, *_ in outbox.queue] == ["b", "c"]
+    assert not outbox.connected
+
+
+def test_full_queue_drops_the_oldest():
+    outbox = StoreAndForward(max_queued=2)
+    outbox.set_client(FakeClient())
+    for topic in "abc":
+        outbox.publish(topic, b"")
+    assert [topic for topic, *_ in outbox.queue] == ["b", "c"]
+    assert outbox.dropped == 1
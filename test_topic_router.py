@@ -0,0 +1,97 @@
+import math
+import time
+
+from bracelet_frame import encode_frame
+from topic_router import TopicRouter, parse_text_value
+
+VALUES = (36.6, 80.5, 97.0, 120.25)
+
+
+def recording_router(**kwargs):
+    router = TopicRouter(**kwargs)
+    calls = []
+    router.register_all(lambda bracelet_id, metric, value: calls.append((bracelet_id, metric, value)))
+    return router, calls
+
+
+def test_parse_text_value_accepts_bytes_and_str():
+    assert parse_text_value(b"Heart Rate: 80.5") == 80.5
+    assert parse_text_value("Blood Sugar: 120") == 120.0
+
+
+def test_text_message_reaches_its_metric_handlers():
+    router, calls = recording_router()
+    other = []
+    router.register("oxygen", lambda *args: other.append(args))
+    assert router.dispatch("smartbracelet/12/heart_rate", b"Heart Rate: 80.5")
+    assert router.dispatch("smartbracelet/12/heart_rate", "Heart Rate: 81")
+    assert calls == [("12", "heart_rate", 80.5), ("12", "heart_rate", 81.0)]
+    assert other == []
+
+
+def test_unknown_topics_and_bad_payloads_are_dropped():
+    router, calls = recording_router()
+    assert not router.dispatch("other/12/heart_rate", b"Heart Rate: 80")
+    assert not router.dispatch("smartbracelet/12/pulse", b"Pulse: 80")
+    assert not router.dispatch("smartbracelet/12/heart_rate", b"Heart Rate: fast")
+    assert not router.dispatch("smartbracelet/12/heart_rate", b"\xff\xfe")
+    assert calls == []
+    assert router.bad_payloads == 2
+
+
+def test_register_after_dispatch_takes_effect():
+    router, calls = recording_router()
+    router.dispatch("smartbracelet/1/sugar", b"Blood Sugar: 100")
+    late = []
+    router.register("sugar", lambda *args: late.append(args))
+    router.dispatch("smartbracelet/1/sugar", b"Blood Sugar: 101")
+    assert late == [("1", "sugar", 101.0)]
+
+
+def test_frame_fans_out_to_metric_and_frame_handlers():
+    router, calls = recording_router()
+    frames = []
+    router.register_frame(lambda *args: frames.append(args))
+    assert router.dispatch("smartbracelet/7/frame", encode_frame(VALUES, 3, 1000.0))
+    assert frames == [("7", 3, 1000.0, VALUES)]
+    assert calls == [("7", metric, value) for metric, value in
+                     zip(("body_temp", "heart_rate", "oxygen", "sugar"), VALUES)]
+
+
+def test_snapshots_count_only_when_retained_and_fresh():
+    router, calls = recording_router(snapshot_max_age=60)
+    fresh = encode_frame(VALUES, 1, time.time())
+    stale = encode_frame(VALUES, 1, time.time() - 600)
+    assert not router.dispatch("smartbracelet/7/snapshot", fresh)
+    assert calls == []
+    assert not router.dispatch_retained("smartbracelet/7/snapshot", stale)
+    assert not router.dispatch_retained("smartbracelet/7/snapshot", b"")  # A cleared snapshot
+    assert calls == []
+    assert router.dispatch_retained("smartbracelet/7/snapshot", fresh)
+    assert len(calls) == 4
+    assert router.bad_payloads == 0
+
+
+def test_replayed_readings_keep_their_time_and_skip_live_handlers():
+    router, calls = recording_router()
+    replayed = []
+    router.register_replay(lambda *args: replayed.append(args))
+    values = (VALUES[0], math.nan, VALUES[2], VALUES[3])  # heart_rate went out live
+    assert router.dispatch("smartbracelet/7/replay", encode_frame(values, 1, 1000.0, "json"))
+    assert calls == []
+    assert replayed == [("7", "body_temp", VALUES[0], 1000.0), ("7", "oxygen", VALUES[2], 1000.0),
+                        ("7", "sugar", VALUES[3], 1000.0)]
+
+
+def test_replay_without_handlers_is_not_taken():
+    router, calls = recording_router()
+    assert not router.dispatch("smartbracelet/7/replay", encode_frame(VALUES, 1, 1000.0))
+    assert calls == []
+
+
+def test_route_cache_is_bounded():
+    router, calls = recording_router(max_cached_topics=10)
+    for bracelet in range(25):
+        router.dispatch(f"smartbracelet/{bracelet}/oxygen", b"Oxygen Level: 97")
+    assert len(router.routes) <= 10
+    assert len(calls) == 25
@@ -0,0 +1,51 @@
+import time
+
+from vitals_store import VitalsStore
+
+
+def filled_store(path, **kwargs):
+    store = VitalsStore(str(path), flush_interval=0.01, **kwargs)
+    for ts in range(0, 180, 30):
+        store.add("1", "heart_rate", 60 + ts, ts=1000.0 + ts)
+    store.add(2, "heart_rate", 99, ts=1000.0)
+    store.add("1", "oxygen", 97, ts=1000.0)
+    store.close()
+    return store
+
+
+def test_range_returns_one_bracelet_and_metric_in_order(tmp_path):
+    store = filled_store(tmp_path / "vitals.db")
+    assert store.inserted == 8
+    assert store.range("1", "heart_rate", 1030, 1120) == [(1030.0, 90.0), (1060.0, 120.0), (1090.0, 150.0)]
+    assert store.range(2, "heart_rate", 0, 2000) == [(1000.0, 99.0)]
+    assert sorted(store.bracelets()) == ["1", "2"]
+
+
+def test_aggregate_buckets_by_minute(tmp_path):
+    store = filled_store(tmp_path / "vitals.db")
+    rows = store.aggregate("1", "heart_rate", 960, 1200)
+    assert rows == [(960, 60.0, 60.0, 60.0, 1), (1020, 90.0, 120.0, 105.0, 2), (1080, 150.0, 180.0, 165.0, 2),
+                    (1140, 210.0, 210.0, 210.0, 1)]
+
+
+def test_purge_deletes_only_old_readings(tmp_path):
+    store = filled_store(tmp_path / "vitals.db")
+    assert store.purge(1060) == 4
+    assert store.range("1", "heart_rate", 0, 2000)[0] == (1060.0, 120.0)
+    assert store.purge(1060) == 0
+
+
+def test_purge_uses_the_ts_index(tmp_path):
+    store = filled_store(tmp_path / "vitals.db")
+    plan = " ".join(row[-1] for row in store.query("EXPLAIN QUERY PLAN DELETE FROM readings WHERE ts < 1"))
+    assert "readings_by_ts" in plan
+
+
+def test_writer_purges_past_the_retention(tmp_path):
+    path = str(tmp_path / "vitals.db")
+    filled_store(path)
+    store = VitalsStore(path, flush_interval=0.01, retention=60)
+    store.add("1", "heart_rate", 70)
+    store.close()
+    assert store.range("1", "heart_rate", 0, time.time() + 1)[0][0] > time.time() - 60
+    assert len(store.range("1", "heart_rate", 0, time.time() + 1)) == 1
@@ -0,0 +1,152 @@
+import sys
+import time
+
+from bracelet_frame import FRAME_METRIC, METRICS, REPLAY_METRIC, SNAPSHOT_METRIC, decode_frame
+
+# Topic layout published by every bracelet: smartbracelet/{bracelet_id}/{metric}
+# where metric is one of METRICS (legacy text payload), FRAME_METRIC (packed frame),
+# SNAPSHOT_METRIC (retained copy of the latest frame) or REPLAY_METRIC (frame queued while offline)
+BRACELET_PREFIX = "smartbracelet"
+
+
+def parse_text_value(payload):
+    """Parse a legacy 'Label: value' payload (bytes or str) into a float."""
+    if isinstance(payload, bytes):
+        return float(payload.rpartition(b": ")[2])
+    return float(payload.rpartition(": ")[2])
+
+
+class TopicRouter:
+    """Dispatch bracelet messages to handlers registered per metric.
+
+    Each topic is split once and cached as an interned (bracelet_id, metric)
+    key together with its handlers, so the hot path is one dict lookup and
+    one float parse instead of a chain of substring tests.
+    Handlers are called as handler(bracelet_id, metric, value). Packed frames
+    are unpacked in one go and fanned out to the same per-metric handlers;
+    frame handlers additionally see handler(bracelet_id, seq, timestamp, values).
+    Snapshots only count when they are the retained copy a new subscription
+    gets (dispatch_retained); live ones repeat values already dispatched.
+    Retained frames older than snapshot_max_age seconds are skipped: a live
+    bracelet refreshes its snapshot at least every heartbeat, so an old one is
+    from a bracelet that went away.
+    Replayed frames hold readings a bracelet queued while offline; they only
+    go to replay handlers, handler(bracelet_id, metric, value, timestamp) with
+    the sample time, so they are never taken for current readings.
+    """
+
+    def __init__(self, max_cached_topics=100000, snapshot_max_age=None):
+        self.handlers = {}       # metric -> tuple of handlers
+        self.frame_handlers = ()
+        self.replay_handlers = ()
+        self.routes = {}         # topic -> (bracelet_id, metric, handlers)
+        self.max_cached_topics = max_cached_topics
+        self.snapshot_max_age = snapshot_max_age
+        self.bad_payloads = 0
+
+    def register(self, metric, handler):
+        metric = sys.intern(metric)
+        self.handlers[metric] = self.handlers.get(metric, ()) + (handler,)
+        self.routes.clear()  # Cached routes hold the old handler tuples
+
+    def register_all(self, handler, metrics=METRICS):
+        for metric in metrics:
+            self.register(metric, handler)
+
+    def register_frame(self, handler):
+        self.frame_handlers += (handler,)
+
+    def register_replay(self, handler):
+        self.replay_handlers += (handler,)
+
+    def parse_topic(self, topic):
+        """Return the interned (bracelet_id, metric) key for a topic, or None."""
+        parts = topic.split("/")
+        if len(parts) == 3 and parts[0] == BRACELET_PREFIX:
+            return sys.intern(parts[1]), sys.intern(parts[2])
+        return None
+
+    def route(self, topic):
+        """Return the cached (bracelet_id, metric, handlers) route for a topic."""
+        route = self.routes.get(topic)
+        if route is None:
+            key = self.parse_topic(topic)
+            if key is None:
+                route = (None, None, ())
+            else:
+                route = (key[0], key[1], self.handlers.get(key[1], ()))
+            if len(self.routes) >= self.max_cached_topics:
+                self.routes.clear()
+            self.routes[topic] = route
+        return route
+
+    def dispatch(self, topic, payload):
+        """Route one message; return False if no handler took it."""
+        route = self.routes.get(topic)
+        if route is None:
+            route = self.route(topic)
+        bracelet_id, metric, handlers = route
+        if metric == FRAME_METRIC:
+            return self.dispatch_frame(bracelet_id, payload)
+        if metric == SNAPSHOT_METRIC:
+            return False
+        if metric == REPLAY_METRIC:
+            return self.dispatch_replay(bracelet_id, payload)
+        if not handlers:
+            return False
+        try:
+            # float() accepts bytes directly, so the payload is never decoded
+            value = float(payload.rpartition(b": ")[2])
+        except (TypeError, ValueError):
+            try:
+                value = parse_text_value(payload)
+            except ValueError:
+                self.bad_payloads += 1
+                return False
+        for handler in handlers:
+            handler(bracelet_id, metric, value)
+        return True
+
+    def dispatch_retained(self, topic, payload):
+        """Route a retained message received on subscribe, snapshots included."""
+        bracelet_id, metric, handlers = self.route(topic)
+        if metric == SNAPSHOT_METRIC or metric == FRAME_METRIC:
+            return self.dispatch_frame(bracelet_id, payload, self.snapshot_max_age)
+        return self.dispatch(topic, payload)
+
+    def dispatch_frame(self, bracelet_id, payload, max_age=None):
+        if not payload:
+            return False  # An empty retained payload only clears a bracelet's snapshot
+        try:
+            seq, timestamp, values = decode_frame(payload)
+        except (KeyError, ValueError):
+            self.bad_payloads += 1
+            return False
+        if max_age is not None and time.time() - timestamp > max_age:
+            return False
+        for handler in self.frame_handlers:
+            handler(bracelet_id, seq, timestamp, values)
+        self.dispatch_values(bracelet_id, values)
+        return True
+
+    def dispatch_replay(self, bracelet_id, payload):
+        if not self.replay_handlers:
+            return False
+        try:
+            seq, timestamp, values = decode_frame(payload)
+        except (KeyError, ValueError):
+            self.bad_payloads += 1
+            return False
+        for metric, value in zip(METRICS, values):
+            if value != value:
+                continue  # NaN, this reading went out live
+            for handler in self.replay_handlers:
+                handler(bracelet_id, metric, value, timestamp)
+        return True
+
+    def dispatch_values(self, bracelet_id, values):
+        """Fan the values of one bracelet (in METRICS order) out to the per-metric handlers."""
+        handlers = self.handlers
+        for metric, value in zip(METRICS, values):
+            for handler in handlers.get(metric, ()):
+                handler(bracelet_id, metric, value)
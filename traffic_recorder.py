@@ -0,0 +1,219 @@
+"""Record bracelet traffic to a file and replay it, for load and regression tests without a live ward.
+
+File format: an 8 byte header (b"BRTR", version, 3 reserved bytes) followed by
+records of "<dHI" (receive time, topic length, payload length), the topic and
+the payload. Records are only ever appended and the reader maps the file, so a
+recording can be read while it is still being written.
+
+Usage:
+    python traffic_recorder.py record traffic.brtr [--topic smartbracelet/#]
+    python traffic_recorder.py replay traffic.brtr [--speed 1] [--host localhost] [--port 1883]
+    python traffic_recorder.py check traffic.brtr [--save expected.json | --expect expected.json]
+
+replay --speed N plays N times faster than recorded, --speed 0 as fast as possible.
+check runs the Hospital alert pipeline over the recording with the recorded
+timestamps and prints the alert transitions; with --expect it exits 1 if they differ.
+"""
+import argparse
+import json
+import mmap
+import struct
+import sys
+import threading
+import time
+
+MAGIC = b"BRTR"
+VERSION = 1
+HEADER = MAGIC + bytes([VERSION, 0, 0, 0])
+RECORD_STRUCT = struct.Struct("<dHI")
+FLUSH_INTERVAL = 1.0  # sec, recorded messages reach the disk at least this often
+
+
+class TrafficWriter:
+    """Append (receive time, topic, payload) records; safe to call from paho's network thread."""
+
+    def __init__(self, path):
+        self.file = open(path, "ab", buffering=1 << 20)
+        if self.file.tell() == 0:
+            self.file.write(HEADER)
+        self.lock = threading.Lock()
+        self.count = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="TrafficFlush", daemon=True)
+        self.thread.start()
+
+    def write(self, topic, payload, ts=None):
+        topic = topic.encode("utf-8")
+        with self.lock:
+            self.file.write(RECORD_STRUCT.pack(time.time() if ts is None else ts, len(topic), len(payload)))
+            self.file.write(topic)
+            self.file.write(payload)
+            self.count += 1
+
+    def run(self):
+        while not self.stop_event.wait(FLUSH_INTERVAL):
+            with self.lock:
+                self.file.flush()
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
+        with self.lock:
+            self.file.close()
+
+
+class TrafficReader:
+    """Iterate over the records of a recording as (receive time, topic, payload) without copying the file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a traffic recording")
+        if self.map[len(MAGIC)] != VERSION:
+            raise ValueError(f"{path} has unsupported version {self.map[len(MAGIC)]}")
+
+    def __iter__(self):
+        data = self.map
+        size = len(data)
+        offset = len(HEADER)
+        unpack = RECORD_STRUCT.unpack_from
+        while offset + RECORD_STRUCT.size <= size:
+            ts, topic_length, payload_length = unpack(data, offset)
+            start = offset + RECORD_STRUCT.size
+            end = start + topic_length + payload_length
+            if end > size:
+                break  # A record still being written
+            yield ts, data[start:start + topic_length].decode("utf-8"), data[start + topic_length:end]
+            offset = end
+
+    def close(self):
+        self.map.close()
+
+
+def replay(reader, client, speed=1.0):
+    """Publish a recording through client with the recorded spacing divided by speed (0 - no pauses)."""
+    start = None
+    count = 0
+    for ts, topic, payload in reader:
+        if speed > 0:
+            if start is None:
+                start = (time.monotonic(), ts)
+            delay = start[0] + (ts - start[1]) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        client.publish(topic, payload)
+        count += 1
+    return count
+
+
+def check_alerts(reader):
+    """Run the Hospital alert pipeline over a recording using the recorded times; return the transitions."""
+    from alert_rules import AlertEvaluator, load_rules
+    from alert_state import AlertTracker
+    from mqtt_init import alert_hold_seconds
+    from topic_router import TopicRouter
+
+    evaluator = AlertEvaluator(load_rules())
+    tracker = AlertTracker(alert_hold_seconds)
+    clock = [0.0, None]  # time of the current record, time of the first record
+    transitions = []
+
+    def check(bracelet_id, metric, value):
+        ts = clock[0]
+        alert, changed = tracker.update(bracelet_id, metric, evaluator.evaluate(bracelet_id, metric, value, ts), ts)
+        if changed:
+            transitions.append([round(ts - clock[1], 3), bracelet_id, metric, alert])
+
+    router = TopicRouter()
+    router.register_all(check)
+    count = 0
+    started = time.perf_counter()
+    for ts, topic, payload in reader:
+        if clock[1] is None:
+            clock[1] = ts
+        clock[0] = ts
+        router.dispatch(topic, payload)
+        count += 1
+    elapsed = time.perf_counter() - started
+    return {
+        "messages": count,
+        "seconds": round(elapsed, 3),
+        "msg_per_s": round(count / elapsed) if elapsed else None,
+        "bad_payloads": router.bad_payloads,
+        "transitions": transitions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and replay smart bracelet MQTT traffic.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="subscribe and append every message to FILE")
+    record.add_argument("file")
+    record.add_argument("--topic", default="smartbracelet/#")
+    play = commands.add_parser("replay", help="publish FILE to a broker")
+    play.add_argument("file")
+    play.add_argument("--speed", type=float, default=1.0, help="1 - recorded pace, N - N times faster, 0 - no pauses")
+    play.add_argument("--host", default="localhost", help="broker to replay to, a local test broker by default")
+    play.add_argument("--port", type=int, default=1883)
+    check = commands.add_parser("check", help="run the alert rules over FILE offline")
+    check.add_argument("file")
+    check.add_argument("--save", help="write the result here as the expected one")
+    check.add_argument("--expect", help="exit 1 if the alert transitions differ from this file")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        reader = TrafficReader(args.file)
+        result = check_alerts(reader)
+        reader.close()
+        print(json.dumps({key: value for key, value in result.items() if key != "transitions"}, indent=2))
+        print(f"{len(result['transitions'])} alert transitions")
+        if args.save:
+            with open(args.save, "w") as file:
+                json.dump(result["transitions"], file, indent=1)
+        if args.expect:
+            with open(args.expect) as file:
+                expected = json.load(file)
+            if expected != result["transitions"]:
+                print(f"Alert transitions differ from {args.expect}")
+                sys.exit(1)
+        return
+
+    import random
+    from mqtt_client import create_client
+
+    client = create_client(f"TrafficRecorder-{random.randrange(1, 10000000)}")
+    if args.command == "record":
+        from mqtt_init import broker_port, resolve_broker
+
+        writer = TrafficWriter(args.file)
+        client.on_message = lambda client, userdata, msg: writer.write(msg.topic, msg.payload)
+        client.on_connect = lambda client, userdata, flags, rc: client.subscribe(args.topic)
+        client.connect(resolve_broker(), int(broker_port))
+        client.loop_start()
+        print(f"Recording {args.topic} to {args.file}, Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(5)
+                print(f"Recorded {writer.count} messages")
+        except KeyboardInterrupt:
+            pass
+        client.loop_stop()
+        client.disconnect()
+        writer.close()
+        return
+
+    client.connect(args.host, args.port)
+    client.loop_start()
+    reader = TrafficReader(args.file)
+    started = time.monotonic()
+    count = replay(reader, client, args.speed)
+    elapsed = time.monotonic() - started
+    print(f"Replayed {count} messages in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} msg/s)")
+    reader.close()
+    client.loop_stop()
+    client.disconnect()
+
+
+if __name__ == "__main__":
+    main()
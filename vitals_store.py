@@ -0,0 +1,165 @@
+"""Embedded time-series store for bracelet vitals (SQLite).
+
+Readings are queued by the MQTT handlers and inserted in batches by a
+background thread; queries open their own connection so they never wait for
+the writer. With retention set, the writer also deletes readings older than
+that many seconds, once every PURGE_INTERVAL, through the index on ts. Range
+and per-minute aggregate queries use the (bracelet_id, metric, ts) primary key.
+
+Usage: python vitals_store.py vitals.db BRACELET_ID METRIC [--minutes 60] [--bucket 60] [--raw]
+"""
+import argparse
+import atexit
+import datetime
+import queue
+import sqlite3
+import threading
+import time
+
+from bracelet_frame import METRICS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    bracelet_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    ts REAL NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (bracelet_id, metric, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS readings_by_ts ON readings (ts);
+"""
+PURGE_INTERVAL = 3600  # sec between retention purges
+
+
+class VitalsStore:
+
+    def __init__(self, path, max_queue=100000, batch_size=2000, flush_interval=0.5, writer=True, retention=None):
+        self.path = path
+        self.retention = retention
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.inserted = 0
+        self.closed = not writer
+        db = self.connect()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+        db.close()
+        if writer:
+            self.thread = threading.Thread(target=self.run, name="VitalsStore", daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def add(self, bracelet_id, metric, value, ts=None):
+        """Queue one reading; returns False if the queue is full and it was dropped."""
+        try:
+            self.queue.put_nowait((bracelet_id, metric, time.time() if ts is None else ts, value))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def close(self, timeout=5.0):
+        """Insert everything still queued and stop the writer thread."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def run(self):
+        db = self.connect()
+        db.execute("PRAGMA synchronous=NORMAL")
+        running = True
+        next_purge = time.monotonic()
+        while running:
+            if self.retention and time.monotonic() >= next_purge:
+                next_purge = time.monotonic() + PURGE_INTERVAL
+                self.purge(time.time() - self.retention)
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            # Wait up to flush_interval to fill the batch so inserts share one transaction
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                running = False
+                batch.pop()
+            if batch:
+                with db:
+                    db.executemany("INSERT OR REPLACE INTO readings VALUES (?, ?, ?, ?)", batch)
+                self.inserted += len(batch)
+        db.close()
+
+    # Queries -------------------------------------------------------------
+
+    def query(self, sql, params=()):
+        db = self.connect()
+        try:
+            return db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+
+    def range(self, bracelet_id, metric, start, end):
+        """Return [(ts, value)] of one bracelet and metric with start <= ts < end."""
+        return self.query(
+            "SELECT ts, value FROM readings WHERE bracelet_id = ? AND metric = ? AND ts >= ? AND ts < ? ORDER BY ts",
+            (str(bracelet_id), metric, start, end))
+
+    def aggregate(self, bracelet_id, metric, start, end, bucket_seconds=60):
+        """Return [(bucket_start, min, max, mean, count)] per time bucket (one minute by default)."""
+        return self.query(
+            "SELECT CAST(ts / :bucket AS INTEGER) * :bucket AS bucket, MIN(value), MAX(value), AVG(value), COUNT(*) "
+            "FROM readings WHERE bracelet_id = :bracelet AND metric = :metric AND ts >= :start AND ts < :end "
+            "GROUP BY bucket ORDER BY bucket",
+            {"bucket": bucket_seconds, "bracelet": str(bracelet_id), "metric": metric, "start": start, "end": end})
+
+    def bracelets(self):
+        return [row[0] for row in self.query("SELECT DISTINCT bracelet_id FROM readings")]
+
+    def purge(self, older_than):
+        """Delete readings with ts < older_than; returns the number of deleted rows."""
+        db = self.connect()
+        try:
+            with db:
+                return db.execute("DELETE FROM readings WHERE ts < ?", (older_than,)).rowcount
+        finally:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query historical vitals of one bracelet.")
+    parser.add_argument("db", help="vitals database file, e.g. vitals.db")
+    parser.add_argument("bracelet_id")
+    parser.add_argument("metric", choices=METRICS)
+    parser.add_argument("--minutes", type=float, default=60, help="how far back to look")
+    parser.add_argument("--bucket", type=int, default=60, help="aggregate bucket in seconds")
+    parser.add_argument("--raw", action="store_true", help="print every reading instead of aggregates")
+    args = parser.parse_args()
+
+    end = time.time()
+    start = end - args.minutes * 60
+    store = VitalsStore(args.db, writer=False)
+    if args.raw:
+        for ts, value in store.range(args.bracelet_id, args.metric, start, end):
+            print(f"{datetime.datetime.fromtimestamp(ts):%Y-%m-%d %H:%M:%S}  {value}")
+        return
+    print("time                 min      max      mean     count")
+    for bucket, low, high, mean, count in store.aggregate(args.bracelet_id, args.metric, start, end, args.bucket):
+        print(f"{datetime.datetime.fromtimestamp(bucket):%Y-%m-%d %H:%M}     {low:<8} {high:<8} {mean:<8.2f} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import time
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+from PyQt5.QtGui import QBrush, QColor
+
+from bracelet_frame import METRICS
+from bracelet_metrics import METRIC_LABELS, bracelet_order
+
+COLUMNS = ("Bracelet", "Patient", "Status") + tuple(METRIC_LABELS[metric] for metric in METRICS) + ("Last update",)
+PATIENT_COLUMN = 1
+FIRST_METRIC_COLUMN = 3
+LAST_UPDATE_COLUMN = len(COLUMNS) - 1
+CRITICAL_ROW = QBrush(QColor(255, 220, 220))
+CRITICAL_VALUE = QBrush(QColor(200, 0, 0))
+
+
+class WardTableModel(QAbstractTableModel):
+    """One row per bracelet with its latest values, critical bracelets first.
+
+    Fed from the GUI thread with the batches GuiBridge coalesces: update()
+    stores the new values and emits one dataChanged per run of adjacent
+    changed rows, over the value and Last update columns only, so a view
+    repaints just those cells. Rows are
+    reordered only when the set of critical bracelets changes. The Patient
+    column asks patient_of(bracelet_id) (e.g. PatientRegistry.lookup) for the
+    visible rows only.
+    """
+
+    def __init__(self, parent=None, patient_of=None):
+        super().__init__(parent)
+        self.patient_of = patient_of
+        self.rows = []       # bracelet ids in display order
+        self.row_of = {}     # bracelet_id -> row
+        self.values = {}     # bracelet_id -> list with one value per metric
+        self.updated = {}    # bracelet_id -> time of the latest reading
+        self.critical = {}   # bracelet_id -> critical metrics
+        self.metric_column = {metric: FIRST_METRIC_COLUMN + index for index, metric in enumerate(METRICS)}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        bracelet_id = self.rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return bracelet_id
+            if column == PATIENT_COLUMN:
+                patient = self.patient_of(bracelet_id) if self.patient_of else None
+                return "" if patient is None else patient.label()
+            if column == 2:
+                return "CRITICAL" if bracelet_id in self.critical else "OK"
+            if column == LAST_UPDATE_COLUMN:
+                return time.strftime("%H:%M:%S", time.localtime(self.updated[bracelet_id]))
+            value = self.values[bracelet_id][column - FIRST_METRIC_COLUMN]
+            return "" if value is None else str(value)
+        critical = self.critical.get(bracelet_id)
+        if critical is None:
+            return None
+        if role == Qt.BackgroundRole:
+            return CRITICAL_ROW
+        if role == Qt.ForegroundRole and FIRST_METRIC_COLUMN <= column < LAST_UPDATE_COLUMN \
+                and METRICS[column - FIRST_METRIC_COLUMN] in critical:
+            return CRITICAL_VALUE
+        return None
+
+    def update(self, readings):
+        """Apply {(bracelet_id, metric): value}; new bracelets get a row, each run of changed rows one dataChanged."""
+        now = time.time()
+        new = []
+        for (bracelet_id, metric), value in readings.items():
+            values = self.values.get(bracelet_id)
+            if values is None:
+                values = self.values[bracelet_id] = [None] * len(METRICS)
+                new.append(bracelet_id)
+            values[self.metric_column[metric] - FIRST_METRIC_COLUMN] = value
+            self.updated[bracelet_id] = now
+        if new:
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(new) - 1)
+            for bracelet_id in new:
+                self.row_of[bracelet_id] = len(self.rows)
+                self.rows.append(bracelet_id)
+            self.endInsertRows()
+            self.resort()
+        changed = sorted({self.row_of[bracelet_id] for bracelet_id, _ in readings})
+        start = 0
+        for position, row in enumerate(changed):
+            if position + 1 == len(changed) or changed[position + 1] != row + 1:
+                self.dataChanged.emit(self.index(changed[start], FIRST_METRIC_COLUMN),
+                                      self.index(row, LAST_UPDATE_COLUMN))
+                start = position + 1
+
+    def patients_changed(self):
+        """Repaint the Patient column after the registry changed."""
+        if self.rows:
+            self.dataChanged.emit(self.index(0, PATIENT_COLUMN), self.index(len(self.rows) - 1, PATIENT_COLUMN))
+
+    def set_critical(self, critical):
+        """Apply {bracelet_id: critical metrics} from EmergencyStateTable.critical_snapshot()."""
+        if critical == self.critical:
+            return
+        self.critical = critical
+        self.resort()
+        if self.rows:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.rows) - 1, LAST_UPDATE_COLUMN))
+
+    def sort_key(self, bracelet_id):
+        return bracelet_id not in self.critical, bracelet_order(bracelet_id)
+
+    def resort(self):
+        order = sorted(self.rows, key=self.sort_key)
+        if order == self.rows:
+            return
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        moved = [(self.rows[index.row()], index.column()) for index in persistent]
+        self.rows = order
+        self.row_of = {bracelet_id: row for row, bracelet_id in enumerate(order)}
+        self.changePersistentIndexList(persistent, [self.index(self.row_of[bracelet_id], column)
+                                                    for bracelet_id, column in moved])
+        self.layoutChanged.emit()